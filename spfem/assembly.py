@@ -26,12 +26,130 @@ the Poisson problem using the piecewise linear elements.
 import numpy as np
 import inspect
 import abc
-from scipy.sparse import coo_matrix
+import ast
+from operator import itemgetter
+from multiprocessing.pool import ThreadPool
+from scipy.sparse import coo_matrix, csr_matrix
 
 import spfem.mesh
 import spfem.mapping
 from spfem.quadrature import get_quadrature
-from spfem.utils import const_cell, cell_shape
+from spfem.utils import const_cell, cell_shape, LazyZero
+
+def _integrate(values, dx, W):
+    """Integrate form values over each element using the quadrature
+    weights W and the scaling dx. Values that are known to vanish
+    (:class:`spfem.utils.LazyZero`) are not evaluated."""
+    if isinstance(values, LazyZero):
+        return 0.0
+    return np.dot(values*dx, W)
+
+# the variables that the assemblers pass to forms
+_FORM_ARGS = ['u', 'v', 'du', 'dv', 'ddu', 'ddv', 'x', 'w', 'dw', 'h', 'n',
+              'u1', 'u2', 'v1', 'v2', 'du1', 'du2', 'dv1', 'dv2']
+
+# forms compiled by form(), by expression
+_forms = {}
+
+class _FoldConstants(ast.NodeTransformer):
+    """Evaluate the arithmetic subexpressions that do not depend on the
+    arguments of a form once, at compile time."""
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.count = 0
+
+    def visit(self, node):
+        if isinstance(node, (ast.BinOp, ast.UnaryOp)) and \
+                self._is_constant(node):
+            expr = ast.fix_missing_locations(ast.Expression(body=node))
+            name = '_c%d' % self.count
+            self.count += 1
+            self.namespace[name] = eval(compile(expr, '<form>', 'eval'),
+                                        self.namespace)
+            return ast.copy_location(ast.Name(id=name, ctx=ast.Load()), node)
+        return self.generic_visit(node)
+
+    def _is_constant(self, node):
+        for child in ast.walk(node):
+            if isinstance(child, ast.Call):
+                return False
+            if isinstance(child, ast.Name) and child.id in _FORM_ARGS:
+                return False
+        return True
+
+def form(expr):
+    """Compile a form from the expression of its integrand.
+
+    The arguments of the form are the variables used in the expression
+    (see :meth:`AssemblerElement.iasm`). Other names refer to numpy,
+    either directly (pi, sin) or through np. Subexpressions that do not
+    depend on the arguments are evaluated once. The compiled forms are
+    cached by expression.
+
+    Example
+    -------
+    ::
+
+        K = a.iasm(form("du[0]*dv[0] + du[1]*dv[1]"))
+        f = a.iasm(form("2*pi**2*sin(pi*x[0])*sin(pi*x[1])*v"))
+    """
+    if expr not in _forms:
+        namespace = {'np': np}
+        args = []
+        for node in ast.walk(ast.parse(expr, mode='eval')):
+            if not isinstance(node, ast.Name) or node.id in namespace:
+                continue
+            if node.id in _FORM_ARGS:
+                if node.id not in args:
+                    args.append(node.id)
+            elif hasattr(np, node.id):
+                namespace[node.id] = getattr(np, node.id)
+            else:
+                raise ValueError("form(): unknown variable '%s'." % node.id)
+
+        tree = ast.parse("lambda %s: (%s)" % (", ".join(args), expr),
+                         mode='eval')
+        tree.body.body = _FoldConstants(namespace).visit(tree.body.body)
+        ast.fix_missing_locations(tree)
+        _forms[expr] = eval(compile(tree, '<form>', 'eval'), namespace)
+
+    return _forms[expr]
+
+def _csr_template(rows, cols, shape):
+    """Find the CSR structure of a matrix assembled from triplets.
+
+    Returns
+    -------
+    indptr, indices : numpy arrays
+        The CSR structure with sorted and unique column indices.
+    pos : numpy array
+        The position of each triplet in the CSR data array, so that the
+        data is np.bincount(pos, weights=values, minlength=len(indices)).
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+
+    # a single integer key orders the triplets by (row, col)
+    key, pos = np.unique(rows*shape[1] + cols, return_inverse=True)
+    indices = key % shape[1]
+    indptr = np.searchsorted(key // shape[1], np.arange(shape[0] + 1))
+
+    return indptr, indices, pos
+
+def _csr(data, rows, cols, shape, template=None):
+    """Build a CSR matrix from triplets, summing the duplicate entries.
+    The structure can be given as the precomputed
+    _csr_template(rows, cols, shape)."""
+    if len(data) == 0:
+        return csr_matrix(shape)
+    if template is None:
+        template = _csr_template(rows, cols, shape)
+    indptr, indices, pos = template
+
+    values = np.bincount(pos, weights=data, minlength=len(indices))
+    A = csr_matrix((values, indices, indptr), shape=shape)
+    A.has_sorted_indices = True
+    return A
 
 class Assembler(object):
     """Finite element assembler."""
@@ -181,75 +299,23 @@ class Assembler(object):
                     y.append(ix)
                     break
 
-        if len(oldargs) == 1:
-            def newform(*x):
-                return oldform(x[y[0]])
-        elif len(oldargs) == 2:
-            def newform(*x):
-                return oldform(x[y[0]], x[y[1]])
-        elif len(oldargs) == 3:
-            def newform(*x):
-                return oldform(x[y[0]], x[y[1]], x[y[2]])
-        elif len(oldargs) == 4:
-            def newform(*x):
-                return oldform(x[y[0]], x[y[1]], x[y[2]], x[y[3]])
-        elif len(oldargs) == 5:
-            def newform(*x):
-                return oldform(x[y[0]], x[y[1]], x[y[2]], x[y[3]], x[y[4]])
-        elif len(oldargs) == 6:
-            def newform(*x):
-                return oldform(x[y[0]], x[y[1]], x[y[2]], x[y[3]], x[y[4]],
-                               x[y[5]])
-        elif len(oldargs) == 7:
-            def newform(*x):
-                return oldform(x[y[0]], x[y[1]], x[y[2]], x[y[3]], x[y[4]],
-                               x[y[5]], x[y[6]])
-        elif len(oldargs) == 8:
-            def newform(*x):
-                return oldform(x[y[0]], x[y[1]], x[y[2]], x[y[3]], x[y[4]],
-                               x[y[5]], x[y[6]], x[y[7]])
-        elif len(oldargs) == 9:
-            def newform(*x):
-                return oldform(x[y[0]], x[y[1]], x[y[2]], x[y[3]], x[y[4]],
-                               x[y[5]], x[y[6]], x[y[7]], x[y[8]])
-        elif len(oldargs) == 10:
-            def newform(*x):
-                return oldform(x[y[0]], x[y[1]], x[y[2]], x[y[3]], x[y[4]],
-                               x[y[5]], x[y[6]], x[y[7]], x[y[8]], x[y[9]])
-        elif len(oldargs) == 11:
-            def newform(*x):
-                return oldform(x[y[0]], x[y[1]], x[y[2]], x[y[3]], x[y[4]],
-                               x[y[5]], x[y[6]], x[y[7]], x[y[8]], x[y[9]],
-                               x[y[10]])
-        elif len(oldargs) == 12:
-            def newform(*x):
-                return oldform(x[y[0]], x[y[1]], x[y[2]], x[y[3]], x[y[4]],
-                               x[y[5]], x[y[6]], x[y[7]], x[y[8]], x[y[9]],
-                               x[y[10]], x[y[11]])
-        elif len(oldargs) == 13:
-            def newform(*x):
-                return oldform(x[y[0]], x[y[1]], x[y[2]], x[y[3]], x[y[4]],
-                               x[y[5]], x[y[6]], x[y[7]], x[y[8]], x[y[9]],
-                               x[y[10]], x[y[11]], x[y[12]])
-        elif len(oldargs) == 14:
-            def newform(*x):
-                return oldform(x[y[0]], x[y[1]], x[y[2]], x[y[3]], x[y[4]],
-                               x[y[5]], x[y[6]], x[y[7]], x[y[8]], x[y[9]],
-                               x[y[10]], x[y[11]], x[y[12]], x[y[13]])
-        elif len(oldargs) == 15:
+        if len(y) != len(oldargs):
+            unknown = [oarg for oarg in oldargs if oarg not in newargs]
+            raise Exception("Unknown arguments " + str(unknown) + " in the "
+                            "form! The allowed arguments are " +
+                            str(newargs) + ".")
+
+        if len(y) == 0:
             def newform(*x):
-                return oldform(x[y[0]], x[y[1]], x[y[2]], x[y[3]], x[y[4]],
-                               x[y[5]], x[y[6]], x[y[7]], x[y[8]], x[y[9]],
-                               x[y[10]], x[y[11]], x[y[12]], x[y[13]],
-                               x[y[14]])
-        elif len(oldargs) == 16:
+                return oldform()
+        elif len(y) == 1:
+            # itemgetter with a single index returns the item itself
             def newform(*x):
-                return oldform(x[y[0]], x[y[1]], x[y[2]], x[y[3]], x[y[4]],
-                               x[y[5]], x[y[6]], x[y[7]], x[y[8]], x[y[9]],
-                               x[y[10]], x[y[11]], x[y[12]], x[y[13]],
-                               x[y[14]], x[y[15]])
+                return oldform(x[y[0]])
         else:
-            raise NotImplementedError("Maximum number of arguments reached.")
+            pick = itemgetter(*y)
+            def newform(*x):
+                return oldform(*pick(x))
 
         return newform
 
@@ -380,7 +446,7 @@ class AssemblerAbstract(Assembler):
         #            w[k] += interp[k][jdofs][:, None]*self.u[j]
 
         dim = self.mesh.p.shape[0]
-        zero = 0.0*x[0]
+        zero = np.zeros_like(x[0])
         w, dw, ddw, d4w = ({} for i in range(4))
         if interp is not None:
             if not isinstance(interp, dict):
@@ -665,7 +731,7 @@ class AssemblerAbstract(Assembler):
         dim = self.mesh.p.shape[0]
 
         # interpolate the solution vectors at quadrature points
-        zero = 0.0*x[0]
+        zero = np.zeros_like(x[0])
         w, dw, ddw, d4w = ({} for i in range(4))
         for k in interp:
             w[k] = zero
@@ -809,8 +875,18 @@ class AssemblerElement(Assembler):
         The mesh will give some sort of default mapping but sometimes, e.g.
         when using isoparametric elements, the user might have to provide
         a different mapping.
+
+    threads : (OPTIONAL) int
+        The number of threads used by :meth:`iasm` for evaluating the
+        forms on large meshes. The forms must then be safe to call
+        concurrently. By default, the assembly is serial.
+
+    thread_cutoff : (OPTIONAL) int
+        The smallest number of elements that is assembled with threads.
+        Default 10000.
     """
-    def __init__(self, mesh, elem_u, elem_v=None, mapping=None):
+    def __init__(self, mesh, elem_u, elem_v=None, mapping=None, threads=1,
+                 thread_cutoff=10000):
         if not isinstance(mesh, spfem.mesh.Mesh):
             raise Exception("First parameter must be an instance of "
                             "spfem.mesh.Mesh!")
@@ -836,6 +912,74 @@ class AssemblerElement(Assembler):
             self.elem_v = elem_v
             self.dofnum_v = Dofnum(mesh, elem_v)
 
+        # local bases at the quadrature points, see _precomputed
+        self._basis_cache = {}
+
+        # CSR structure of the matrices assembled over the whole mesh
+        self._pattern = None
+
+        self.threads = threads
+        self.thread_cutoff = thread_cutoff
+
+    def _precomputed(self, elem, X, intorder, N):
+        """Return the local basis of elem at the quadrature points X of
+        the given order. It is the same on every element so it is
+        evaluated once per element and quadrature rule."""
+        key = (elem, intorder)
+        if key not in self._basis_cache:
+            self._basis_cache[key] = elem.precompute_at(X, N)
+        return self._basis_cache[key]
+
+    def _map(self, f, items, pool):
+        """Call f for each item, in the threads of pool unless it is None.
+        The calls must write to disjoint outputs; numpy releases the GIL
+        in the array operations of the forms."""
+        if pool is not None:
+            pool.map(f, items)
+        else:
+            for item in items:
+                f(item)
+
+    def iqpoints(self, intorder=None, tind=None):
+        """Return the global quadrature points used by :meth:`iasm`
+        with the same intorder and tind, e.g. for evaluating
+        coefficients of the forms in advance.
+
+        Returns
+        -------
+        numpy array
+            x[0], x[1], ... of size Nelems x Nqp.
+        """
+        if tind is None:
+            tind = range(self.mesh.t.shape[1])
+        if intorder is None:
+            intorder = self.elem_u.maxdeg + self.elem_v.maxdeg
+
+        X, _ = get_quadrature(self.mesh.refdom, intorder)
+
+        return self.mapping.F(X, tind)
+
+    def fqpoints(self, find=None, interior=False, intorder=None):
+        """Return the global quadrature points used by :meth:`fasm`
+        with the same find, interior and intorder.
+
+        Returns
+        -------
+        numpy array
+            x[0], x[1], ... of size Nfacets x Nqp.
+        """
+        if find is None:
+            if interior:
+                find = self.mesh.interior_facets()
+            else:
+                find = self.mesh.boundary_facets()
+        if intorder is None:
+            intorder = self.elem_u.maxdeg + self.elem_v.maxdeg
+
+        X, _ = get_quadrature(self.mesh.brefdom, intorder)
+
+        return self.mapping.G(X, find=find)
+
     def iasm(self, form, intorder=None, tind=None, interp=None):
         """Return a matrix related to a bilinear or linear form
         where the integral is over the interior of the domain.
@@ -916,6 +1060,40 @@ class AssemblerElement(Assembler):
             The indices of elements that are integrated over.
             By default, all elements of the mesh are included.
         """
+        return self.iasm_multi([form], intorder=intorder, tind=tind,
+                               interp=interp)[0]
+
+    def iasm_multi(self, forms, intorder=None, tind=None, interp=None):
+        """Assemble several bilinear and/or linear forms in a single pass.
+
+        The quadrature points, the Jacobian and the basis functions are
+        evaluated once and shared by all the forms. See :meth:`iasm` for
+        the parameters.
+
+        Returns
+        -------
+        list
+            The matrices and vectors in the order of forms.
+        """
+        if tind is None:
+            nt = self.mesh.t.shape[1]
+        else:
+            nt = len(tind)
+
+        # the threads are shared by all the forms
+        if self.threads > 1 and nt >= self.thread_cutoff:
+            pool = ThreadPool(self.threads)
+        else:
+            pool = None
+        try:
+            return self._iasm_multi(forms, intorder, tind, interp, pool)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def _iasm_multi(self, forms, intorder, tind, interp, pool):
+        full_mesh = tind is None
         if tind is None:
             # assemble on all elements by default
             tind = range(self.mesh.t.shape[1])
@@ -924,16 +1102,6 @@ class AssemblerElement(Assembler):
             # compute the maximum polynomial degree from elements
             intorder = self.elem_u.maxdeg + self.elem_v.maxdeg
 
-        # check and fix parameters of form
-        oldparams = inspect.getargspec(form).args
-        if 'u' in oldparams or 'du' in oldparams:
-            paramlist = ['u', 'v', 'du', 'dv', 'x', 'w', 'h']
-            bilinear = True
-        else:
-            paramlist = ['v', 'dv', 'x', 'w', 'h']
-            bilinear = False
-        fform = self.fillargs(form, paramlist)
-
         # quadrature points and weights
         X, W = get_quadrature(self.mesh.refdom, intorder)
 
@@ -942,6 +1110,7 @@ class AssemblerElement(Assembler):
 
         # jacobian at quadrature points
         detDF = self.mapping.detDF(X, tind)
+        absdetDF = np.abs(detDF)
 
         Nbfun_u = self.dofnum_u.t_dof.shape[0]
         Nbfun_v = self.dofnum_v.t_dof.shape[0]
@@ -952,58 +1121,101 @@ class AssemblerElement(Assembler):
             if not isinstance(interp, dict):
                 raise Exception("The input solution vector(s) must be in a "
                                 "dictionary! Pass e.g. {0:u} instead of u.")
+            # the local basis is evaluated once for all j, also for
+            # elements that evaluate every basis function at once
+            Xu = self._precomputed(self.elem_u, X, intorder, Nbfun_u)
+            if (isinstance(Xu, spfem.element.PrecomputedBasis) and
+                    len(Xu.phi) == Nbfun_u):
+                phi = Xu.phi
+            else:
+                phi = np.array([self.elem_u.lbasis(X, j)[0]
+                                for j in range(Nbfun_u)])
+            udofs = self.dofnum_u.t_dof[:, tind]
             for k in interp:
-                w[k] = 0.0*x[0]
-                for j in range(Nbfun_u):
-                    phi, _ = self.elem_u.lbasis(X, j)
-                    w[k] += np.outer(interp[k][self.dofnum_u.t_dof[j, :]], phi)
+                # w[k][e, q] = sum_j interp[k][udofs[j, e]]*phi[j, q]
+                w[k] = interp[k][udofs].T.dot(phi)
 
         # compute the mesh parameter from jacobian determinant
-        h = np.abs(detDF)**(1.0/self.mesh.dim())
+        h = absdetDF**(1.0/self.mesh.dim())
 
-        # bilinear form
-        if bilinear:
-            # initialize sparse matrix structures
-            data = np.zeros(Nbfun_u*Nbfun_v*nt)
-            rows = np.zeros(Nbfun_u*Nbfun_v*nt)
-            cols = np.zeros(Nbfun_u*Nbfun_v*nt)
+        # evaluate the basis functions once, they are reused by all forms
+        Xv = self._precomputed(self.elem_v, X, intorder, Nbfun_v)
+        vbasis = self.elem_v.gbasis_all(self.mapping, Xv, tind, Nbfun_v)
+        ubasis = None
 
-            for j in range(Nbfun_u):
-                u, du = self.elem_u.gbasis(self.mapping, X, j, tind)
-                for i in range(Nbfun_v):
-                    v, dv = self.elem_v.gbasis(self.mapping, X, i, tind)
+        # global dofs of the local basis functions of v, Nbfun_v x Nelems
+        vdofs = self.dofnum_v.t_dof[:, tind].astype(np.int64)
 
-                    # find correct location in data,rows,cols
-                    ixs = slice(nt*(Nbfun_v*j+i), nt*(Nbfun_v*j+i+1))
+        results = []
+        for form in forms:
+            # check and fix parameters of form
+            oldparams = inspect.getargspec(form).args
+            if 'u' in oldparams or 'du' in oldparams:
+                paramlist = ['u', 'v', 'du', 'dv', 'x', 'w', 'h']
+                bilinear = True
+            else:
+                paramlist = ['v', 'dv', 'x', 'w', 'h']
+                bilinear = False
+            fform = self.fillargs(form, paramlist)
+
+            # bilinear form
+            if bilinear:
+                if ubasis is None:
+                    if self.elem_u is self.elem_v:
+                        ubasis = vbasis
+                    else:
+                        Xu = self._precomputed(self.elem_u, X, intorder,
+                                               Nbfun_u)
+                        ubasis = self.elem_u.gbasis_all(self.mapping, Xu,
+                                                        tind, Nbfun_u)
+
+                    # global dofs of the entries in data below, the block
+                    # data[j, i] holds the entries related to (u_j, v_i)
+                    rows = np.tile(vdofs.ravel(), Nbfun_u)
+                    cols = np.repeat(self.dofnum_u.t_dof[:, tind], Nbfun_v,
+                                     axis=0).ravel()
+                    shape = (self.dofnum_v.N, self.dofnum_u.N)
+
+                    # the sparsity pattern of the whole mesh is reused
+                    if full_mesh:
+                        if self._pattern is None:
+                            self._pattern = _csr_template(rows, cols, shape)
+                        template = self._pattern
+                    else:
+                        template = _csr_template(rows, cols, shape)
 
+                data = np.zeros((Nbfun_u, Nbfun_v, nt))
+
+                def local(ji, fform=fform, data=data):
                     # compute entries of local stiffness matrices
-                    data[ixs] = np.dot(fform(u, v, du, dv, x, w, h)
-                                       * np.abs(detDF), W)
-                    rows[ixs] = self.dofnum_v.t_dof[i, tind]
-                    cols[ixs] = self.dofnum_u.t_dof[j, tind]
+                    j, i = ji
+                    u, du = ubasis[j]
+                    v, dv = vbasis[i]
+                    data[j, i] = _integrate(fform(u, v, du, dv, x, w, h),
+                                            absdetDF, W)
 
-            return coo_matrix((data, (rows, cols)),
-                              shape=(self.dofnum_v.N, self.dofnum_u.N)).tocsr()
+                self._map(local, [(j, i) for j in range(Nbfun_u)
+                                  for i in range(Nbfun_v)], pool)
 
-        else:
-            # initialize sparse matrix structures
-            data = np.zeros(Nbfun_v*nt)
-            rows = np.zeros(Nbfun_v*nt)
-            cols = np.zeros(Nbfun_v*nt)
+                results.append(_csr(data.ravel(), rows, cols, shape,
+                                    template=template))
 
-            for i in range(Nbfun_v):
-                v, dv = self.elem_v.gbasis(self.mapping, X, i, tind)
+            else:
+                data = np.zeros((Nbfun_v, nt))
 
-                # find correct location in data,rows,cols
-                ixs = slice(nt*i, nt*(i+1))
+                def local(i, fform=fform, data=data):
+                    # compute entries of local load vectors
+                    v, dv = vbasis[i]
+                    data[i] = _integrate(fform(v, dv, x, w, h), absdetDF, W)
 
-                # compute entries of local stiffness matrices
-                data[ixs] = np.dot(fform(v, dv, x, w, h)*np.abs(detDF), W)
-                rows[ixs] = self.dofnum_v.t_dof[i, tind]
-                cols[ixs] = np.zeros(nt)
+                self._map(local, range(Nbfun_v), pool)
 
-            return coo_matrix((data, (rows, cols)),
-                              shape=(self.dofnum_v.N, 1)).toarray().T[0]
+                # sum the contributions to each dof
+                results.append(np.bincount(vdofs.ravel(),
+                                           weights=data.ravel(),
+                                           minlength=self.dofnum_v.N))
+
+        return results
 
     def fasm(self, form, find=None, interior=False, intorder=None,
              normals=True, interp=None):
@@ -1072,6 +1284,11 @@ class AssemblerElement(Assembler):
         else: # exception for 1D mesh (no boundary h defined)
             h = None
 
+        # the basis of u on the first elements is shared by the
+        # interpolation and the bilinear form
+        if bilinear or interp is not None:
+            ubasis1 = self.elem_u.gbasis_all(self.mapping, Y1, tind1, Nbfun_u)
+
         # interpolate some previous discrete function at quadrature points
         w = {}
         dw = {}
@@ -1080,10 +1297,10 @@ class AssemblerElement(Assembler):
                 raise Exception("The input solution vector(s) must be in a "
                                 "dictionary! Pass e.g. {0:u} instead of u.")
             for k in interp:
-                w[k] = 0.0*x[0]
-                dw[k] = const_cell(0.0*x[0], dim)
+                w[k] = np.zeros_like(x[0])
+                dw[k] = const_cell(np.zeros_like(x[0]), dim)
                 for j in range(Nbfun_u):
-                    phi, dphi = self.elem_u.gbasis(self.mapping, Y1, j, tind1)
+                    phi, dphi = ubasis1[j]
                     w[k] += interp[k][self.dofnum_u.t_dof[j, tind1], None]*phi
                     for a in range(dim):
                         dw[k][a] += interp[k][self.dofnum_u.t_dof[j, tind1], None]*dphi[a]
@@ -1101,18 +1318,26 @@ class AssemblerElement(Assembler):
                 rows = np.zeros(ndata)
                 cols = np.zeros(ndata)
 
+            # evaluate the basis functions once, they are reused in the loop
+            vbasis1 = self.elem_v.gbasis_all(self.mapping, Y1, tind1, Nbfun_v)
+            if interior:
+                ubasis2 = self.elem_u.gbasis_all(self.mapping, Y2, tind2,
+                                                 Nbfun_u)
+                vbasis2 = self.elem_v.gbasis_all(self.mapping, Y2, tind2,
+                                                 Nbfun_v)
+
             for j in range(Nbfun_u):
-                u1, du1 = self.elem_u.gbasis(self.mapping, Y1, j, tind1)
+                u1, du1 = ubasis1[j]
                 if interior:
-                    u2, du2 = self.elem_u.gbasis(self.mapping, Y2, j, tind2)
+                    u2, du2 = ubasis2[j]
                     if j == 0:
                         # these are zeros corresponding to the shapes of u,du
                         z = const_cell(0, *cell_shape(u2))
                         dz = const_cell(0, *cell_shape(du2))
                 for i in range(Nbfun_v):
-                    v1, dv1 = self.elem_v.gbasis(self.mapping, Y1, i, tind1)
+                    v1, dv1 = vbasis1[i]
                     if interior:
-                        v2, dv2 = self.elem_v.gbasis(self.mapping, Y2, i, tind2)
+                        v2, dv2 = vbasis2[i]
 
                     # compute entries of local stiffness matrices
                     if interior:
@@ -1125,62 +1350,61 @@ class AssemblerElement(Assembler):
                         ixs4 = slice(ne*(Nbfun_v*j + i) + 3*ndata,
                                      ne*(Nbfun_v*j + i + 1) + 3*ndata)
 
-                        data[ixs1] = np.dot(fform(u1, z, v1, z,
-                                                  du1, dz, dv1, dz,
-                                                  x, h, n, w, dw)*np.abs(detDG), W)
+                        data[ixs1] = _integrate(fform(u1, z, v1, z,
+                                                      du1, dz, dv1, dz,
+                                                      x, h, n, w, dw), np.abs(detDG), W)
                         rows[ixs1] = self.dofnum_v.t_dof[i, tind1]
                         cols[ixs1] = self.dofnum_u.t_dof[j, tind1]
 
-                        data[ixs2] = np.dot(fform(z, u2, z, v2,
-                                                  dz, du2, dz, dv2,
-                                                  x, h, n, w, dw)*np.abs(detDG), W)
+                        data[ixs2] = _integrate(fform(z, u2, z, v2,
+                                                      dz, du2, dz, dv2,
+                                                      x, h, n, w, dw), np.abs(detDG), W)
                         rows[ixs2] = self.dofnum_v.t_dof[i, tind2]
                         cols[ixs2] = self.dofnum_u.t_dof[j, tind2]
 
-                        data[ixs3] = np.dot(fform(z, u2, v1, z,
-                                                  dz, du2, dv1, dz,
-                                                  x, h, n, w, dw)*np.abs(detDG), W)
+                        data[ixs3] = _integrate(fform(z, u2, v1, z,
+                                                      dz, du2, dv1, dz,
+                                                      x, h, n, w, dw), np.abs(detDG), W)
                         rows[ixs3] = self.dofnum_v.t_dof[i, tind1]
                         cols[ixs3] = self.dofnum_u.t_dof[j, tind2]
 
-                        data[ixs4] = np.dot(fform(u1, z, z, v2,
-                                                  du1, dz, dz, dv2,
-                                                  x, h, n, w, dw)*np.abs(detDG), W)
+                        data[ixs4] = _integrate(fform(u1, z, z, v2,
+                                                      du1, dz, dz, dv2,
+                                                      x, h, n, w, dw), np.abs(detDG), W)
                         rows[ixs4] = self.dofnum_v.t_dof[i, tind2]
                         cols[ixs4] = self.dofnum_u.t_dof[j, tind1]
                     else:
                         ixs = slice(ne*(Nbfun_v*j + i), ne*(Nbfun_v*j + i + 1))
-                        data[ixs] = np.dot(fform(u1, v1, du1, dv1,
-                                                 x, h, n, w, dw)*np.abs(detDG), W)
+                        data[ixs] = _integrate(fform(u1, v1, du1, dv1,
+                                                     x, h, n, w, dw), np.abs(detDG), W)
                         rows[ixs] = self.dofnum_v.t_dof[i, tind1]
                         cols[ixs] = self.dofnum_u.t_dof[j, tind1]
 
-            return coo_matrix((data, (rows, cols)),
-                              shape=(self.dofnum_v.N, self.dofnum_u.N)).tocsr()
+            return _csr(data, rows, cols, (self.dofnum_v.N, self.dofnum_u.N))
 
         # linear form
         else:
             if interior:
                 # could not find any use case
                 raise Exception("No interior support in linear facet form.")
-            # initialize sparse matrix structures
+            # initialize the local load vectors and their global dofs
             data = np.zeros(Nbfun_v*ne)
-            rows = np.zeros(Nbfun_v*ne)
-            cols = np.zeros(Nbfun_v*ne)
+            rows = np.zeros(Nbfun_v*ne, dtype=np.int64)
+
+            vbasis1 = self.elem_v.gbasis_all(self.mapping, Y1, tind1, Nbfun_v)
 
             for i in range(Nbfun_v):
-                v1, dv1 = self.elem_v.gbasis(self.mapping, Y1, i, tind1)
+                v1, dv1 = vbasis1[i]
 
-                # find correct location in data,rows,cols
+                # find correct location in data,rows
                 ixs = slice(ne*i, ne*(i + 1))
 
                 # compute entries of local stiffness matrices
-                data[ixs] = np.dot(fform(v1, dv1, x, h, n, w, dw)*np.abs(detDG), W)
+                data[ixs] = _integrate(fform(v1, dv1, x, h, n, w, dw), np.abs(detDG), W)
                 rows[ixs] = self.dofnum_v.t_dof[i, tind1]
-                cols[ixs] = np.zeros(ne)
 
-            return coo_matrix((data, (rows, cols)),
-                              shape=(self.dofnum_v.N, 1)).toarray().T[0]
+            # sum the contributions to each dof
+            return np.bincount(rows, weights=data, minlength=self.dofnum_v.N)
 
     def fnorm(self, form, interp, intorder=None, interior=False, normals=True):
         if interior:
@@ -1246,14 +1470,16 @@ class AssemblerElement(Assembler):
             if not isinstance(interp, dict):
                 raise Exception("The input solution vector(s) must be in a "
                                 "dictionary! Pass e.g. {0:u} instead of u.")
+            ubasis1 = self.elem_u.gbasis_all(self.mapping, Y1, tind1, Nbfun_u)
+            ubasis2 = self.elem_u.gbasis_all(self.mapping, Y2, tind2, Nbfun_u)
             for k in interp:
-                w1[k] = 0.0*x[0]
-                dw1[k] = const_cell(0.0*x[0], dim)
-                w2[k] = 0.0*x[0]
-                dw2[k] = const_cell(0.0*x[0], dim)
+                w1[k] = np.zeros_like(x[0])
+                dw1[k] = const_cell(np.zeros_like(x[0]), dim)
+                w2[k] = np.zeros_like(x[0])
+                dw2[k] = const_cell(np.zeros_like(x[0]), dim)
                 for j in range(Nbfun_u):
-                    phi1, dphi1 = self.elem_u.gbasis(self.mapping, Y1, j, tind1)
-                    phi2, dphi2 = self.elem_u.gbasis(self.mapping, Y2, j, tind2)
+                    phi1, dphi1 = ubasis1[j]
+                    phi2, dphi2 = ubasis2[j]
                     w1[k] += interp[k][self.dofnum_u.t_dof[j, tind1], None]*phi1
                     w2[k] += interp[k][self.dofnum_u.t_dof[j, tind2], None]*phi2
                     for a in range(dim):
@@ -1330,15 +1556,17 @@ class AssemblerElement(Assembler):
         dim = self.mesh.p.shape[0]
 
         # interpolate the solution vectors at quadrature points
-        zero = 0.0*x[0]
+        zero = np.zeros_like(x[0])
         w, dw = ({} for i in range(2))
+        Xu = self._precomputed(self.elem_u, X, intorder, Nbfun_u)
+        ubasis = self.elem_u.gbasis_all(self.mapping, Xu, tind, Nbfun_u)
         for k in interp:
             w[k] = zero
             dw[k] = const_cell(zero, dim)
             for j in range(Nbfun_u):
                 jdofs = self.dofnum_u.t_dof[j, :]
                 #phi, dphi = self.elem_u.lbasis(X, j)
-                phi, dphi = self.elem_u.gbasis(self.mapping, X, j, tind)
+                phi, dphi = ubasis[j]
                 #w[k] += np.outer(interp[k][jdofs], phi)
                 w[k] += interp[k][self.dofnum_u.t_dof[j, tind], None]*phi
                 for a in range(dim):
@@ -1439,7 +1667,7 @@ class AssemblerElement(Assembler):
         # assemble some helper matrices
         # the idea is to use the identity: (u-uh,u-uh)=(u,u)+(uh,uh)-2(u,uh)
         def uv(du, dv):
-            if not isinstance(du, dict):
+            if not isinstance(du, dict) and du.ndim == 2:
                 return du*dv
             elif len(du) == 2:
                 return du[0]*dv[0] + du[1]*dv[1]
@@ -1450,8 +1678,10 @@ class AssemblerElement(Assembler):
                                           "implemented for current domain "
                                           "dimension!")
 
+        dim = self.mesh.dim()
+
         def fv(dv, x):
-            if not isinstance(x, dict):
+            if dim == 1:
                 return dexact(x)*dv
             elif len(x) == 2:
                 return dexact[0](x)*dv[0] + dexact[1](x)*dv[1]
@@ -1469,7 +1699,7 @@ class AssemblerElement(Assembler):
         detDF = self.mapping.detDF(X)
         x = self.mapping.F(X)
 
-        if not isinstance(x, dict):
+        if dim == 1:
             uu = np.sum(np.dot((dexact(x)**2) * np.abs(detDF), W))
         elif len(x) == 2:
             uu = np.sum(np.dot((dexact[0](x)**2 + dexact[1](x)**2)
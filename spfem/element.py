@@ -9,7 +9,7 @@ Try for example the following actual implementations:
 import numpy as np
 import matplotlib.pyplot as plt
 from numpy.polynomial.polynomial import polyder, polyval2d
-from spfem.utils import const_cell
+from spfem.utils import const_cell, LazyZero
 
 class Element(object):
     """A finite element defined through basis functions."""
@@ -22,6 +22,8 @@ class Element(object):
     f_dofs = 0 #: Number of facet dofs (2d and 3d only)
     e_dofs = 0 #: Number of edge dofs (3d only)
 
+    dtype = np.float64 #: Floating point type of the global basis
+
     def lbasis(self, X, i):
         """Returns local basis functions evaluated at some local points."""
         raise NotImplementedError("Local basis (lbasis) not implemented!")
@@ -30,6 +32,34 @@ class Element(object):
         """Returns global basis functions evaluated at some local points."""
         raise NotImplementedError("Global basis (gbasis) not implemented!")
 
+    def gbasis_all(self, mapping, X, tind, N):
+        """Returns the global basis functions 0,...,N-1 as a list of
+        (u, du) pairs. Subclasses may override this to share work
+        between the basis functions."""
+        return [self.gbasis(mapping, X, i, tind) for i in range(N)]
+
+    def precompute_at(self, X, N):
+        """Evaluates the local basis functions 0,...,N-1 at the local
+        points X once so that they can be reused on every element. The
+        result is passed to gbasis and gbasis_all in place of X. By
+        default nothing is precomputed and X is returned as is."""
+        return X
+
+class PrecomputedBasis(object):
+    """Local basis functions evaluated at fixed local points,
+    see :meth:`Element.precompute_at`."""
+
+    def __init__(self,X,phi,dphi):
+        self.X=X #: The local points
+        self.phi=phi #: Basis function values, phi[i,q]
+        self.dphi=dphi #: Local derivatives, dphi[i,d,q] (dphi[i,q] in 1D)
+
+def _points(X):
+    """The local points, also when given as a PrecomputedBasis."""
+    if isinstance(X,PrecomputedBasis):
+        return X.X
+    return X
+
 class AbstractElement(object):
     """A finite element defined through DOF functionals."""
 
@@ -98,10 +128,11 @@ class AbstractElement(object):
         V = np.linalg.inv(V)
 
         # initialize
-        u = const_cell(0*qps[0], N)
-        du = const_cell(0*qps[0], N, self.dim)
-        ddu = const_cell(0*qps[0], N, self.dim, self.dim)
-        d4u = const_cell(0*qps[0], N, self.dim, self.dim)
+        zero = np.zeros_like(qps[0])
+        u = const_cell(zero, N)
+        du = const_cell(zero, N, self.dim)
+        ddu = const_cell(zero, N, self.dim, self.dim)
+        d4u = const_cell(zero, N, self.dim, self.dim)
 
         # loop over new basis
         for jtr in range(N):
@@ -164,7 +195,7 @@ class AbstractElement(object):
 
     def plot_lagmult(self, mesh, dofnum, sol, minval, maxval, lambdaeval, nref=2, cbar=True):
         """Draw plate obstacle lagrange multiplier on refined mesh."""
-        print "Plotting on a refined mesh. This is slowish due to loop over elements..."
+        print("Plotting on a refined mesh. This is slowish due to loop over elements...")
         import copy
         import spfem.mesh as fmsh
         plt.figure()
@@ -181,7 +212,7 @@ class AbstractElement(object):
             u, _, _, d4u = self.evalbasis(M, qps, [0])
             newu = u[0].flatten()*0.0
             #newd4u = d4u[0].flatten()*0.0
-            newd4u = const_cell(0*qps[0], self.dim, self.dim)
+            newd4u = const_cell(np.zeros_like(qps[0]), self.dim, self.dim)
             for jtr in range(len(u)):
                 newu += sol[dofnum.t_dof[jtr, itr]]*u[jtr].flatten()
                 newd4u[0][0] += sol[dofnum.t_dof[jtr, itr]]*d4u[jtr][0][0].flatten()
@@ -194,13 +225,13 @@ class AbstractElement(object):
                 totmaxval=np.max(tmp)
             m.plot(tmp.flatten(), nofig=True, smooth=True, zlim=(minval, maxval))
             plt.hold('on')
-        print "Maximum value: " + str(totmaxval)
+        print("Maximum value: " + str(totmaxval))
         if cbar:
             plt.colorbar()
 
     def plot_refined(self, mesh, dofnum, sol, minval, maxval, nref=2):
         """Draw a discrete function on refined mesh."""
-        print "Plotting on a refined mesh. This is slowish due to loop over elements..."
+        print("Plotting on a refined mesh. This is slowish due to loop over elements...")
         import copy
         import spfem.mesh as fmsh
         plt.figure()
@@ -296,7 +327,7 @@ class AbstractElementTriPp(AbstractElement):
 
         self.n_dofs = 1
         self.f_dofs = np.max([p - 1, 0])
-        self.i_dofs = np.max([(p - 1)*(p - 2)/2, 0])
+        self.i_dofs = np.max([(p - 1)*(p - 2)//2, 0])
 
         self.nbdofs = 3*self.n_dofs + 3*self.f_dofs + self.i_dofs
 
@@ -408,10 +439,7 @@ class ElementHdiv(Element):
         if isinstance(X,dict):
             raise NotImplementedError("Calling ElementHdiv gbasis with dict not implemented!")
         else:
-            x={}
-            x[0]=X[0,:]
-            x[1]=X[1,:]
-            [phi,dphi]=self.lbasis(x,i)
+            [phi,dphi]=self.lbasis(X,i)
 
         DF=mapping.DF(X,tind)
         detDF=mapping.detDF(X,tind)
@@ -432,67 +460,126 @@ class ElementTriRT0(ElementHdiv):
     dim=2
 
     def lbasis(self,X,i):
-        phi={}
-        phi[0]={
-                0:lambda x,y: x,
-                1:lambda x,y: x,
-                2:lambda x,y: -x+1.,
-                }[i](X[0],X[1])
-        phi[1]={
-                0:lambda x,y: y-1.,
-                1:lambda x,y: y,
-                2:lambda x,y: -y,
-                }[i](X[0],X[1])
-        dphi={
-            0:lambda x,y: 2+0.*x,
-            1:lambda x,y: 2+0.*x,
-            2:lambda x,y: -2+0.*x,
-            }[i](X[0],X[1])
+        x=X[0]
+        y=X[1]
+        if i==0:
+            phi=np.array([x,y-1.])
+            dphi=2.
+        elif i==1:
+            phi=np.array([x,y])
+            dphi=2.
+        elif i==2:
+            phi=np.array([-x+1.,-y])
+            dphi=-2.
+        else:
+            raise IndexError("ElementTriRT0.lbasis: basis function index out of range.")
 
         return phi,dphi
 
 class ElementH1(Element):
     """Abstract :math:`H^1` conforming finite element."""
 
-    def gbasis(self,mapping,X,i,tind):
-        if isinstance(X,dict):
+    # constant local gradients, one row per basis function, if the element has them
+    _dphi_const=None
+
+    def gbasis(self,mapping,X,i,tind,invDF=None):
+        if isinstance(X,PrecomputedBasis):
+            phi,dphi=X.phi[i],X.dphi[i]
+            X=X.X
+        else:
             [phi,dphi]=self.lbasis(X,i)
+            phi=np.asarray(phi,dtype=self.dtype)
+            dphi=np.asarray(dphi,dtype=self.dtype)
+
+        if invDF is None:
+            invDF=mapping.invDF(X,tind,dtype=self.dtype)
+
+        if isinstance(X,dict):
             u=phi
-            du={}
         else:
-            x={}
-            x[0]=X[0,:]
-            if mapping.dim>=2:
-                x[1]=X[1,:]
-            if mapping.dim>=3:
-                x[2]=X[2,:]
-            [phi,dphi]=self.lbasis(x,i)
-            u=np.tile(phi,(len(tind),1))
-            du={}
-            
-        invDF=mapping.invDF(X,tind) # investigate if 'x' should used after else
+            # a read-only view, every element shares the same values
+            u=np.broadcast_to(phi,(len(tind),X.shape[1]))
 
         self.dim=mapping.dim
 
-        if mapping.dim==1:
+        if self._dphi_const is not None:
+            du=self._gbasis_const(mapping,i,invDF)
+        elif mapping.dim==1:
             du=np.outer(invDF,dphi)
-        elif mapping.dim==2:
-            du[0]=invDF[0][0]*dphi[0]+invDF[1][0]*dphi[1]
-            du[1]=invDF[0][1]*dphi[0]+invDF[1][1]*dphi[1]
-        elif mapping.dim==3:
-            du[0]=invDF[0][0]*dphi[0]+invDF[1][0]*dphi[1]+invDF[2][0]*dphi[2]
-            du[1]=invDF[0][1]*dphi[0]+invDF[1][1]*dphi[1]+invDF[2][1]*dphi[2]
-            du[2]=invDF[0][2]*dphi[0]+invDF[1][2]*dphi[1]+invDF[2][2]*dphi[2]
+        elif mapping.dim==2 or mapping.dim==3:
+            # du[i]=sum_j invDF[j][i]*dphi[j]
+            du=np.einsum('ji...,j...->i...',invDF,dphi)
         else:
             raise NotImplementedError("ElementH1.gbasis: not implemented for the given dim.")
 
         return u,du
 
+    def gbasis_all(self,mapping,X,tind,N):
+        # invDF is the same for all basis functions
+        invDF=mapping.invDF(_points(X),tind,dtype=self.dtype)
+        if (not isinstance(X,PrecomputedBasis) or self._dphi_const is not None
+                or mapping.dim not in (2,3)):
+            return [self.gbasis(mapping,X,i,tind,invDF) for i in range(N)]
+
+        # transform the gradients of all basis functions at once,
+        # du[i,k]=sum_j invDF[j][k]*dphi[i,j]
+        du=np.einsum('jket,ijt->iket',invDF,X.dphi[:N])
+        shape=(len(tind),X.X.shape[1])
+        self.dim=mapping.dim
+        return [(np.broadcast_to(X.phi[i],shape),du[i]) for i in range(N)]
+
+    def lbasis_batch(self,X,N):
+        """Evaluate the local basis functions 0,...,N-1 at the points X.
+
+        Returns
+        -------
+        phi : np.array
+            The basis functions, phi[i,q].
+        dphi : np.array
+            The partial derivatives, dphi[i,d,q] (dphi[i,q] in 1D).
+        """
+        shape=X.shape[1:]
+        if self.dim>1:
+            dshape=(self.dim,)+shape
+        else:
+            dshape=shape
+        phi=np.empty((N,)+shape)
+        dphi=np.empty((N,)+dshape)
+        for i in range(N):
+            [phi[i],d]=self.lbasis(X,i)
+            # constant gradients are returned without the point axis
+            d=np.asarray(d)
+            dphi[i]=d.reshape(d.shape+(1,)*(len(dshape)-d.ndim))
+
+        return phi,dphi
+
+    def precompute_at(self,X,N):
+        if isinstance(X,dict):
+            # facet points differ from element to element
+            return X
+        [phi,dphi]=self.lbasis_batch(X,N)
+        return PrecomputedBasis(X,phi.astype(self.dtype,copy=False),
+                                dphi.astype(self.dtype,copy=False))
+
+    def _gbasis_const(self,mapping,i,invDF):
+        """Global gradient for elements with constant local gradients.
+        The gradients enter as scalars and zero entries are skipped
+        so nothing is evaluated at the quadrature points for them."""
+        c=self._dphi_const[i]
+        # a single array of size dim x Nelems x Nqp
+        du=np.zeros((mapping.dim,)+invDF.shape[2:],dtype=self.dtype)
+        for k in range(mapping.dim):
+            for j in range(mapping.dim):
+                if c[j]!=0:
+                    du[k]+=c[j]*invDF[j][k]
+
+        return du
+
 class ElementH1Vec(ElementH1):
     """Convert :math:`H^1` element to vectorial :math:`H^1` element."""
     def __init__(self,elem):
         if elem.dim==0:
-            print "ElementH1Vec.__init__(): Warning! Parent element has no dim-variable!"
+            print("ElementH1Vec.__init__(): Warning! Parent element has no dim-variable!")
         self.dim=elem.dim
         self.elem=elem
         # multiplicate the amount of DOF's with dim
@@ -502,78 +589,103 @@ class ElementH1Vec(ElementH1):
         self.e_dofs=self.elem.e_dofs*self.dim
         self.maxdeg=elem.maxdeg
 
-    def gbasis(self,mapping,X,i,tind):
-        ind=np.floor(float(i)/float(self.dim))
-        n=i-self.dim*ind
+    def gbasis(self,mapping,X,i,tind,invDF=None):
+        ind,n=divmod(i,self.dim)
 
-        u={}
-        du={}
+        if invDF is None:
+            invDF=mapping.invDF(_points(X),tind,dtype=self.dtype)
+        phi,dphi=self._sbasis(mapping,X,ind,tind,invDF)
 
-        if isinstance(X,dict):
+        return self._component(phi,dphi,n)
+
+    def gbasis_all(self,mapping,X,tind,N):
+        # the scalar basis is evaluated once and shared by all components
+        invDF=mapping.invDF(_points(X),tind,dtype=self.dtype)
+        if isinstance(X,PrecomputedBasis) and mapping.dim in (2,3):
+            # transform the gradients of the scalar basis at once
+            du=np.einsum('jket,ijt->iket',invDF,X.dphi[:N//self.dim])
+            shape=(len(tind),X.X.shape[1])
+            sbasis=[(np.broadcast_to(X.phi[ind],shape),du[ind])
+                    for ind in range(N//self.dim)]
+        else:
+            sbasis=[self._sbasis(mapping,X,ind,tind,invDF)
+                    for ind in range(N//self.dim)]
+
+        basis=[]
+        for phi,dphi in sbasis:
+            for n in range(self.dim):
+                basis.append(self._component(phi,dphi,n))
+
+        return basis
+
+    def _sbasis(self,mapping,X,ind,tind,invDF):
+        # global scalar basis function ind of the parent element
+        if isinstance(X,PrecomputedBasis):
+            phi,dphi=X.phi[ind],X.dphi[ind]
+            X=X.X
+        else:
             [phi,dphi]=self.elem.lbasis(X,ind)
+        phi=np.asarray(phi,dtype=self.dtype)
+        dphi=np.asarray(dphi,dtype=self.dtype)
+        if not isinstance(X,dict):
+            # dphi is broadcast against invDF below
+            phi=np.broadcast_to(phi,(len(tind),X.shape[1]))
+
+        if mapping.dim==2 or mapping.dim==3:
+            du=np.einsum('ji...,j...->i...',invDF,dphi)
         else:
-            x={}
-            x[0]=X[0,:]
-            x[1]=X[1,:]
-            if mapping.dim>=3:
-                x[2]=X[2,:]
-            [phi,dphi]=self.elem.lbasis(x,ind)
-            phi=np.tile(phi,(len(tind),1))
-            for itr in range(self.dim):
-                dphi[itr]=np.tile(dphi[itr],(len(tind),1))
+            raise NotImplementedError("ElementH1Vec.gbasis: not implemented for the given dim.")
 
+        return phi,du
+
+    def precompute_at(self,X,N):
+        # only the scalar basis of the parent element is needed
+        return self.elem.precompute_at(X,N//self.dim)
+
+    def _component(self,phi,dphi,n):
         # fill appropriate slots of u and du (u[0] -> x-component of u etc.)
+        u={}
+        du={}
         for itr in range(self.dim):
             if itr==n:
                 u[itr]=phi
-                invDF=mapping.invDF(X,tind) # investigate if 'x' should used after else
-                du[itr]={}
-                if mapping.dim==2:
-                    du[itr][0]=invDF[0][0]*dphi[0]+invDF[1][0]*dphi[1]
-                    du[itr][1]=invDF[0][1]*dphi[0]+invDF[1][1]*dphi[1]
-                elif mapping.dim==3:
-                    du[itr][0]=invDF[0][0]*dphi[0]+invDF[1][0]*dphi[1]+invDF[2][0]*dphi[2]
-                    du[itr][1]=invDF[0][1]*dphi[0]+invDF[1][1]*dphi[1]+invDF[2][1]*dphi[2]
-                    du[itr][2]=invDF[0][2]*dphi[0]+invDF[1][2]*dphi[1]+invDF[2][2]*dphi[2]
-                else:
-                    raise NotImplementedError("ElementH1Vec.gbasis: not implemented for the given dim.")
+                du[itr]=dphi
             else:
-                u[itr]=0*phi
+                # known zeros, skipped by the assembler
+                u[itr]=LazyZero(np.shape(phi))
                 du[itr]={}
                 for jtr in range(self.dim):
-                    du[itr][jtr]=0*phi
-            
+                    du[itr][jtr]=u[itr]
+
         return u,du
-        
+
 class ElementQ1(ElementH1):
     """Simplest quadrilateral element."""
     
     maxdeg=2
     n_dofs=1
     dim=2
-        
+
+    # the basis is a tensor product of 1D bases, basis function i is
+    # L[_ix[i]](x)*L[_iy[i]](y)
+    _ix=(0,1,1,0)
+    _iy=(0,0,1,1)
+
+    @staticmethod
+    def _lbasis1d(x,k):
+        # 1D linear basis on [-1,1] and its derivative
+        if k==0:
+            return 0.5*(1-x),-0.5
+        else:
+            return 0.5*(1+x),0.5
+
     def lbasis(self,X,i):
-        phi={
-            0:lambda x,y: 0.25*(1-x)*(1-y),
-            1:lambda x,y: 0.25*(1+x)*(1-y),
-            2:lambda x,y: 0.25*(1+x)*(1+y),
-            3:lambda x,y: 0.25*(1-x)*(1+y)
-            }[i](X[0],X[1])
-        dphi={}
-        dphi[0]={
-            0:lambda x,y: 0.25*(-1+y),
-            1:lambda x,y: 0.25*(1-y),
-            2:lambda x,y: 0.25*(1+y),
-            3:lambda x,y: 0.25*(-1-y)
-            }[i](X[0],X[1])
-        dphi[1]={
-            0:lambda x,y: 0.25*(-1+x),
-            1:lambda x,y: 0.25*(-1-x),
-            2:lambda x,y: 0.25*(1+x),
-            3:lambda x,y: 0.25*(1-x)
-            }[i](X[0],X[1])
+        lx,dlx=self._lbasis1d(X[0],self._ix[i])
+        ly,dly=self._lbasis1d(X[1],self._iy[i])
+        phi=lx*ly
+        dphi=np.array([dlx*ly,lx*dly])
         return phi,dphi
-        
+
 class ElementQ2(ElementH1):
     """Second order quadrilateral element."""
 
@@ -582,42 +694,27 @@ class ElementQ2(ElementH1):
     f_dofs=1
     i_dofs=1
     dim=2
-        
+
+    # the basis is a tensor product of 1D bases, basis function i is
+    # L[_ix[i]](x)*L[_iy[i]](y)
+    _ix=(0,1,1,0,2,1,2,0,2)
+    _iy=(0,0,1,1,0,2,1,2,2)
+
+    @staticmethod
+    def _lbasis1d(x,k):
+        # 1D quadratic basis on [-1,1] with nodes -1, 1, 0 and its derivative
+        if k==0:
+            return 0.5*x*(x-1),x-0.5
+        elif k==1:
+            return 0.5*x*(x+1),x+0.5
+        else:
+            return 1-x*x,-2*x
+
     def lbasis(self,X,i):
-        phi={
-            0:lambda x,y: 0.25*(x**2-x)*(y**2-y),
-            1:lambda x,y: 0.25*(x**2+x)*(y**2-y),
-            2:lambda x,y: 0.25*(x**2+x)*(y**2+y),
-            3:lambda x,y: 0.25*(x**2-x)*(y**2+y),
-            4:lambda x,y: 0.5*(y**2-y)*(1-x**2),
-            5:lambda x,y: 0.5*(x**2+x)*(1-y**2),
-            6:lambda x,y: 0.5*(y**2+y)*(1-x**2),
-            7:lambda x,y: 0.5*(x**2-x)*(1-y**2),
-            8:lambda x,y: (1-x**2)*(1-y**2)
-            }[i](X[0],X[1])
-        dphi={}
-        dphi[0]={
-            0:lambda x,y:((-1 + 2*x)*(-1 + y)*y)/4.,
-            1:lambda x,y:((1 + 2*x)*(-1 + y)*y)/4.,
-            2:lambda x,y:((1 + 2*x)*y*(1 + y))/4.,
-            3:lambda x,y:((-1 + 2*x)*y*(1 + y))/4.,
-            4:lambda x,y:-(x*(-1 + y)*y),
-            5:lambda x,y:-((1 + 2*x)*(-1 + y**2))/2.,
-            6:lambda x,y:-(x*y*(1 + y)),
-            7:lambda x,y:-((-1 + 2*x)*(-1 + y**2))/2.,
-            8:lambda x,y:2*x*(-1 + y**2)
-            }[i](X[0],X[1])
-        dphi[1]={
-            0:lambda x,y:((-1 + x)*x*(-1 + 2*y))/4.,
-            1:lambda x,y:(x*(1 + x)*(-1 + 2*y))/4.,
-            2:lambda x,y:(x*(1 + x)*(1 + 2*y))/4.,
-            3:lambda x,y:((-1 + x)*x*(1 + 2*y))/4.,
-            4:lambda x,y:-((-1 + x**2)*(-1 + 2*y))/2.,
-            5:lambda x,y:-(x*(1 + x)*y),
-            6:lambda x,y:-((-1 + x**2)*(1 + 2*y))/2.,
-            7:lambda x,y:-((-1 + x)*x*y),
-            8:lambda x,y:2*(-1 + x**2)*y
-            }[i](X[0],X[1])
+        lx,dlx=self._lbasis1d(X[0],self._ix[i])
+        ly,dly=self._lbasis1d(X[1],self._iy[i])
+        phi=lx*ly
+        dphi=np.array([dlx*ly,lx*dly])
         return phi,dphi
 
 class ElementTriPp(ElementH1):
@@ -631,137 +728,146 @@ class ElementTriPp(ElementH1):
         self.maxdeg=p
         self.n_dofs=1
         self.f_dofs=np.max([p-1,0])
-        self.i_dofs=np.max([(p-1)*(p-2)/2,0])
+        self.i_dofs=np.max([(p-1)*(p-2)//2,0])
 
         self.nbdofs=3*self.n_dofs+3*self.f_dofs+self.i_dofs
 
+        if p>3:
+            # element of order p-3 giving the interior functions
+            self._interior=ElementTriPp(p-3)
+        else:
+            self._interior=None
+
     def intlegpoly(self,x,n):
-        # Generate integrated Legendre polynomials.
+        # Generate integrated Legendre polynomials. The polynomials of all
+        # degrees are kept in single arrays, e.g. P[i] is of degree i.
         n=n+1
-        
-        P={}
-        P[0]=np.ones(x.shape)
-        if n>1:
-            P[1]=x
-        
-        for i in np.arange(1,n):
-            P[i+1]=((2.*i+1.)/(i+1.))*x*P[i]-(i/(i+1.))*P[i-1]
-            
-        iP={}
-        iP[0]=np.ones(x.shape)
+        # coefficients of the Bonnet recursion
+        k=np.arange(1.,n)
+        a=(2.*k+1.)/(k+1.)
+        b=k/(k+1.)
+
+        P=np.empty((n+1,)+x.shape)
+        P[0]=1.
+        P[1]=x
+        for i in range(1,n):
+            P[i+1]=a[i-1]*x*P[i]-b[i-1]*P[i-1]
+
+        iP=np.empty((n,)+x.shape)
+        iP[0]=1.
         if n>1:
             iP[1]=x
-            
-        for i in np.arange(1,n-1):
-            iP[i+1]=(P[i+1]-P[i-1])/(2.*i+1.)
-            
-        dP={}
-        dP[0]=np.zeros(x.shape)
-        for i in np.arange(1,n):
-            dP[i]=P[i-1]
-        
+            c=(2.*k[:-1]+1.).reshape((-1,)+(1,)*x.ndim)
+            iP[2:]=(P[2:n]-P[0:n-2])/c
+
+        dP=np.empty((n,)+x.shape)
+        dP[0]=0.
+        dP[1:]=P[0:n-1]
+
         return iP,dP
         
     def lbasis(self,X,n):
-        # Evaluate n'th Lagrange basis of order self.p.
+        # Evaluate n'th basis function of order self.p.
+        phi,dphi=self.lbasis_all(X)
+        return phi[n],dphi[n]
+
+    def lbasis_batch(self,X,N):
+        phi,dphi=self.lbasis_all(X)
+        return phi[:N],dphi[:N]
+
+    def gbasis_all(self,mapping,X,tind,N):
+        # evaluate the local basis once for all i, also for the facet
+        # points that are not precomputed by the assembler
+        if not isinstance(X,PrecomputedBasis):
+            [phi,dphi]=self.lbasis_all(X)
+            X=PrecomputedBasis(X,phi.astype(self.dtype,copy=False),
+                               dphi.astype(self.dtype,copy=False))
+        if isinstance(X.X,dict):
+            invDF=mapping.invDF(X.X,tind,dtype=self.dtype)
+            return [self.gbasis(mapping,X,i,tind,invDF) for i in range(N)]
+        return ElementH1.gbasis_all(self,mapping,X,tind,N)
+
+    def lbasis_all(self,X):
+        """Evaluate all basis functions of order self.p in a single pass.
+
+        Returns
+        -------
+        phi : np.array
+            The basis functions, phi[n] being the n'th one.
+        dphi : np.array
+            The partial derivatives, dphi[n,0] and dphi[n,1].
+        """
         p=self.p
 
         if len(X)!=2:
             raise NotImplementedError("ElementTriPp: not implemented for the given dimension of X.")
 
-        phi={}
+        phi=np.empty((self.nbdofs,)+X[0].shape)
+        dphi=np.empty((self.nbdofs,2)+X[0].shape)
+        gradphi_x=dphi[:,0]
+        gradphi_y=dphi[:,1]
+
         phi[0]=1.-X[0]-X[1]
         phi[1]=X[0]
         phi[2]=X[1]
-        
-        # local basis function gradients TODO fix these somehow
-        gradphi_x={}
-        gradphi_x[0]=-1.*np.ones(X[0].shape)
-        gradphi_x[1]=1.*np.ones(X[0].shape)
-        gradphi_x[2]=np.zeros(X[0].shape)
-        
-        gradphi_y={}
-        gradphi_y[0]=-1.*np.ones(X[0].shape)
-        gradphi_y[1]=np.zeros(X[0].shape)
-        gradphi_y[2]=1.*np.ones(X[0].shape)
-
-        if n<=2:
-            # return first three
-            dphi={}
-            dphi[0]=gradphi_x[n]
-            dphi[1]=gradphi_y[n]
-            return phi[n],dphi
+
+        # the vertex functions have constant gradients, they are used as
+        # scalars below
+        g=((-1.,-1.),(1.,0.),(0.,1.))
+        for k in range(3):
+            gradphi_x[k]=g[k][0]
+            gradphi_y[k]=g[k][1]
 
         # use same ordering as in mesh
         e=np.array([[0,1],[1,2],[0,2]]).T
         offset=3
-        
+
         # define edge basis functions
         if(p>1):
+            # integrated Legendre polynomials for all edges at once,
+            # P[j,i] is of degree j on edge i
+            eta=phi[e[1]]-phi[e[0]]
+            [P,dP]=self.intlegpoly(eta,p-2)
+            n=len(P)
+
             for i in range(3):
-                eta=phi[e[1,i]]-phi[e[0,i]]
-                deta_x=gradphi_x[e[1,i]]-gradphi_x[e[0,i]]
-                deta_y=gradphi_y[e[1,i]]-gradphi_y[e[0,i]]
-                
-                # generate integrated Legendre polynomials
-                [P,dP]=self.intlegpoly(eta,p-2)
-                
-                for j in range(len(P)):
-                    phi[offset]=phi[e[0,i]]*phi[e[1,i]]*P[j]
-                    gradphi_x[offset]=gradphi_x[e[0,i]]*phi[e[1,i]]*P[j]+\
-                                      gradphi_x[e[1,i]]*phi[e[0,i]]*P[j]+\
-                                      deta_x*phi[e[0,i]]*phi[e[1,i]]*dP[j]
-                    gradphi_y[offset]=gradphi_y[e[0,i]]*phi[e[1,i]]*P[j]+\
-                                      gradphi_y[e[1,i]]*phi[e[0,i]]*P[j]+\
-                                      deta_y*phi[e[0,i]]*phi[e[1,i]]*dP[j]
-                    if offset==n:
-                        # return if computed
-                        dphi={}
-                        dphi[0]=gradphi_x[n]
-                        dphi[1]=gradphi_y[n]
-                        return phi[n],dphi
-                    offset=offset+1  
-        
+                a=e[0,i]
+                b=e[1,i]
+                deta_x=g[b][0]-g[a][0]
+                deta_y=g[b][1]-g[a][1]
+
+                # product of the two vertex functions and its gradient
+                ab=phi[a]*phi[b]
+                dab_x=g[a][0]*phi[b]+g[b][0]*phi[a]
+                dab_y=g[a][1]*phi[b]+g[b][1]*phi[a]
+
+                phi[offset:offset+n]=ab*P[:,i]
+                gradphi_x[offset:offset+n]=dab_x*P[:,i]+deta_x*ab*dP[:,i]
+                gradphi_y[offset:offset+n]=dab_y*P[:,i]+deta_y*ab*dP[:,i]
+                offset=offset+n
+
         # define interior basis functions
         if(p>2):
-            B={}
-            dB_x={}
-            dB_y={}
+            bubble=phi[0]*phi[1]*phi[2]
+            dbubble_x=g[0][0]*phi[1]*phi[2]+\
+                      g[1][0]*phi[2]*phi[0]+\
+                      g[2][0]*phi[0]*phi[1]
+            dbubble_y=g[0][1]*phi[1]*phi[2]+\
+                      g[1][1]*phi[2]*phi[0]+\
+                      g[2][1]*phi[0]*phi[1]
+
             if(p>3):
-                pm3=ElementTriPp(p-3)
-                for itr in range(pm3.nbdofs):
-                    pphi,pdphi=self.lbasis(X,itr)
-                    B[itr]=pphi
-                    dB_x[itr]=pdphi[0]
-                    dB_y[itr]=pdphi[1]
-                N=pm3.nbdofs
+                B,dB=self._interior.lbasis_all(X)
+                phi[offset:]=bubble*B
+                gradphi_x[offset:]=dbubble_x*B+dB[:,0]*bubble
+                gradphi_y[offset:]=dbubble_y*B+dB[:,1]*bubble
             else:
-                B[0]=np.ones(X[0].shape)
-                dB_x[0]=np.zeros(X[0].shape)
-                dB_y[0]=np.zeros(X[0].shape)
-                N=1
-                
-            bubble=phi[0]*phi[1]*phi[2]
-            dbubble_x=gradphi_x[0]*phi[1]*phi[2]+\
-                      gradphi_x[1]*phi[2]*phi[0]+\
-                      gradphi_x[2]*phi[0]*phi[1]
-            dbubble_y=gradphi_y[0]*phi[1]*phi[2]+\
-                      gradphi_y[1]*phi[2]*phi[0]+\
-                      gradphi_y[2]*phi[0]*phi[1]
-            
-            for i in range(N):
-                phi[offset]=bubble*B[i]
-                gradphi_x[offset]=dbubble_x*B[i]+dB_x[i]*bubble
-                gradphi_y[offset]=dbubble_y*B[i]+dB_y[i]*bubble
-                if offset==n:
-                    # return if computed
-                    dphi={}
-                    dphi[0]=gradphi_x[n]
-                    dphi[1]=gradphi_y[n]
-                    return phi[n],dphi
-                offset=offset+1
-
-        raise IndexError("ElementTriPp.lbasis: reached end of lbasis without returning anything.")
+                # the only interior function is the bubble
+                phi[offset]=bubble
+                gradphi_x[offset]=dbubble_x
+                gradphi_y[offset]=dbubble_y
+
+        return phi,dphi
 
 class ElementTriDG(ElementH1):
     """Transform a H1 conforming triangular element
@@ -796,19 +902,11 @@ class ElementTetP0(ElementH1):
     dim=3
 
     def lbasis(self,X,i):
-        phi={
-            0:lambda x,y,z: 1+0*x
-            }[i](X[0],X[1],X[2])
-        dphi={}
-        dphi[0]={
-                0:lambda x,y,z: 0*x
-                }[i](X[0],X[1],X[2])
-        dphi[1]={
-                0:lambda x,y,z: 0*x
-                }[i](X[0],X[1],X[2])
-        dphi[2]={
-                0:lambda x,y,z: 0*x
-                }[i](X[0],X[1],X[2])
+        if i==0:
+            phi=np.ones_like(X[0])
+            dphi=np.zeros(3)
+        else:
+            raise IndexError("ElementTetP0.lbasis: basis function index out of range.")
         return phi,dphi
 
 class ElementTriP0(ElementH1):
@@ -819,16 +917,11 @@ class ElementTriP0(ElementH1):
     dim=2
 
     def lbasis(self,X,i):
-        phi={
-            0:lambda x,y: 1+0*x
-            }[i](X[0],X[1])
-        dphi={}
-        dphi[0]={
-                0:lambda x,y: 0*x
-                }[i](X[0],X[1])
-        dphi[1]={
-                0:lambda x,y: 0*x
-                }[i](X[0],X[1])
+        if i==0:
+            phi=np.ones_like(X[0])
+            dphi=np.zeros(2)
+        else:
+            raise IndexError("ElementTriP0.lbasis: basis function index out of range.")
         return phi,dphi
 
 # this is for legacy
@@ -844,28 +937,24 @@ class ElementTriMini(ElementH1):
     maxdeg=3
 
     def lbasis(self,X,i):
-        phi={
-            0:lambda x,y: 1-x-y,
-            1:lambda x,y: x,
-            2:lambda x,y: y,
-            3:lambda x,y: (1-x-y)*x*y
-            }[i](X[0],X[1])
-
-        dphi={}
-        dphi[0]={
-                0:lambda x,y: -1+0*x,
-                1:lambda x,y: 1+0*x,
-                2:lambda x,y: 0*x,
-                3:lambda x,y: (1-x-y)*y-x*y
-                }[i](X[0],X[1])
-        dphi[1]={
-                0:lambda x,y: -1+0*x,
-                1:lambda x,y: 0*x,
-                2:lambda x,y: 1+0*x,
-                3:lambda x,y: (1-x-y)*x-x*y
-                }[i](X[0],X[1])
+        x=X[0]
+        y=X[1]
+        if i==0:
+            phi=1-x-y
+            dphi=np.array([np.full_like(x,-1.),np.full_like(x,-1.)])
+        elif i==1:
+            phi=x
+            dphi=np.array([np.ones_like(x),np.zeros_like(x)])
+        elif i==2:
+            phi=y
+            dphi=np.array([np.zeros_like(x),np.ones_like(x)])
+        elif i==3:
+            phi=(1-x-y)*x*y
+            dphi=np.array([(1-x-y)*y-x*y,(1-x-y)*x-x*y])
+        else:
+            raise IndexError("ElementTriMini.lbasis: basis function index out of range.")
         return phi,dphi
-        
+
 class ElementTetP2(ElementH1):
     """The quadratic tetrahedral element."""
     
@@ -873,60 +962,49 @@ class ElementTetP2(ElementH1):
     n_dofs=1
     e_dofs=1
     maxdeg=2
-    
+
     def lbasis(self,X,i):
-        
-        phi={ # order (0,0,0) (1,0,0) (0,1,0) (0,0,1) and then according to mesh local t2e
-            0:lambda x,y,z: 1. - 3.*x + 2.*x**2 - 3.*y + 4.*x*y + 2.*y**2 - 3.*z + 4.*x*z + 4.*y*z + 2.*z**2,
-            1:lambda x,y,z: 0. - 1.*x + 2.*x**2,
-            2:lambda x,y,z: 0. - 1.*y + 2.*y**2,
-            3:lambda x,y,z: 0. - 1.*z + 2.*z**2,
-            4:lambda x,y,z: 0. + 4.*x - 4.*x**2 - 4.*x*y - 4.*x*z,
-            5:lambda x,y,z: 0. + 4.*x*y,
-            6:lambda x,y,z: 0. + 4.*y - 4.*x*y - 4.*y**2 - 4.*y*z,
-            7:lambda x,y,z: 0. + 4.*z - 4.*x*z - 4.*y*z - 4.*z**2,
-            8:lambda x,y,z: 0. + 4.*x*z,
-            9:lambda x,y,z: 0. + 4.*y*z,
-            }[i](X[0],X[1],X[2])
-    
-        dphi={}
-        dphi[0]={
-                0:lambda x,y,z: -3. + 4.*x + 4.*y + 4.*z,
-                1:lambda x,y,z: -1. + 4.*x,
-                2:lambda x,y,z: 0.*x,
-                3:lambda x,y,z: 0.*x,
-                4:lambda x,y,z: 4. - 8.*x - 4.*y - 4.*z,
-                5:lambda x,y,z: 4.*y,
-                6:lambda x,y,z: -4.*y,
-                7:lambda x,y,z: -4.*z,
-                8:lambda x,y,z: 4.*z,
-                9:lambda x,y,z: 0.*x,
-                }[i](X[0],X[1],X[2])
-        dphi[1]={
-                0:lambda x,y,z: -3. + 4.*x + 4.*y + 4.*z,
-                1:lambda x,y,z: 0.*x,
-                2:lambda x,y,z: -1. + 4.*y,
-                3:lambda x,y,z: 0.*x,
-                4:lambda x,y,z: -4.*x,
-                5:lambda x,y,z: 4.*x,
-                6:lambda x,y,z: 4. - 4.*x - 8.*y - 4.*z,
-                7:lambda x,y,z: -4.*z,
-                8:lambda x,y,z: 0.*x,
-                9:lambda x,y,z: 4.*z,
-                }[i](X[0],X[1],X[2])
-        dphi[2]={
-                0:lambda x,y,z: -3. + 4.*x + 4.*y + 4.*z,
-                1:lambda x,y,z: 0.*x,
-                2:lambda x,y,z: 0.*x,
-                3:lambda x,y,z: -1. + 4.*z,
-                4:lambda x,y,z: -4.*x,
-                5:lambda x,y,z: 0.*x,
-                6:lambda x,y,z: -4.*y,
-                7:lambda x,y,z: 4. - 4.*x - 4.*y - 8.*z,
-                8:lambda x,y,z: 4.*x,
-                9:lambda x,y,z: 4.*y,       
-                }[i](X[0],X[1],X[2])
-                
+        # order (0,0,0) (1,0,0) (0,1,0) (0,0,1) and then according to mesh local t2e
+        x=X[0]
+        y=X[1]
+        z=X[2]
+        if i==0:
+            s=x+y+z
+            phi=(1.-s)*(1.-2.*s)
+            d=4.*s-3.
+            dphi=np.array([d,d,d])
+        elif i==1:
+            phi=x*(2.*x-1.)
+            dphi=np.array([4.*x-1.,np.zeros_like(x),np.zeros_like(x)])
+        elif i==2:
+            phi=y*(2.*y-1.)
+            dphi=np.array([np.zeros_like(x),4.*y-1.,np.zeros_like(x)])
+        elif i==3:
+            phi=z*(2.*z-1.)
+            dphi=np.array([np.zeros_like(x),np.zeros_like(x),4.*z-1.])
+        elif i==4:
+            r=4.*(1.-x-y-z)
+            phi=x*r
+            dphi=np.array([r-4.*x,-4.*x,-4.*x])
+        elif i==5:
+            phi=4.*x*y
+            dphi=np.array([4.*y,4.*x,np.zeros_like(x)])
+        elif i==6:
+            r=4.*(1.-x-y-z)
+            phi=y*r
+            dphi=np.array([-4.*y,r-4.*y,-4.*y])
+        elif i==7:
+            r=4.*(1.-x-y-z)
+            phi=z*r
+            dphi=np.array([-4.*z,-4.*z,r-4.*z])
+        elif i==8:
+            phi=4.*x*z
+            dphi=np.array([4.*z,np.zeros_like(x),4.*x])
+        elif i==9:
+            phi=4.*y*z
+            dphi=np.array([np.zeros_like(x),4.*z,4.*y])
+        else:
+            raise IndexError("ElementTetP2.lbasis: basis function index out of range.")
         return phi,dphi
 
 class ElementLineP2(ElementH1):
@@ -938,21 +1016,21 @@ class ElementLineP2(ElementH1):
     maxdeg = 2
     
     def lbasis(self, X, i):
-        phi = {
-            0: lambda x: 1-x,
-            1: lambda x: x,
-            2: lambda x: 4*x-4*x**2,
-            }[i](X[0])
-
-        dphi={}
-        dphi={
-                0: lambda x: -1+0*x,
-                1: lambda x: 1+0*x,
-                2: lambda x: 4-8*x,
-                }[i](X[0])
-                
-        return phi, dphi        
-        
+        x = X[0]
+        if i == 0:
+            phi = 1-x
+            dphi = np.full_like(x, -1.)
+        elif i == 1:
+            phi = x
+            dphi = np.ones_like(x)
+        elif i == 2:
+            phi = 4*x-4*x**2
+            dphi = 4-8*x
+        else:
+            raise IndexError("ElementLineP2.lbasis: basis function index out of range.")
+
+        return phi, dphi
+
 class ElementLineP1(ElementH1):
     """Linear element for one dimension."""
 
@@ -961,45 +1039,41 @@ class ElementLineP1(ElementH1):
     maxdeg = 1
     
     def lbasis(self, X, i):
-        phi = {
-            0: lambda x: 1-x,
-            1: lambda x: x,
-            }[i](X[0])
-
-        dphi={}
-        dphi={
-                0: lambda x: -1+0*x,
-                1: lambda x: 1+0*x,
-                }[i](X[0])
-                
-        return phi, dphi        
-        
+        x = X[0]
+        if i == 0:
+            phi = 1-x
+            dphi = np.full_like(x, -1.)
+        elif i == 1:
+            phi = x
+            dphi = np.ones_like(x)
+        else:
+            raise IndexError("ElementLineP1.lbasis: basis function index out of range.")
+
+        return phi, dphi
+
 class ElementTriP1(ElementH1):
     """The simplest triangular element."""
 
     n_dofs=1
     dim=2
     maxdeg=1
-    
+
+    _dphi_const=((-1.,-1.),(1.,0.),(0.,1.))
+
     def lbasis(self,X,i):
-        phi={
-            0:lambda x,y: 1-x-y,
-            1:lambda x,y: x,
-            2:lambda x,y: y
-            }[i](X[0],X[1])
-
-        dphi={}
-        dphi[0]={
-                0:lambda x,y: -1+0*x,
-                1:lambda x,y: 1+0*x,
-                2:lambda x,y: 0*x
-                }[i](X[0],X[1])
-        dphi[1]={
-                0:lambda x,y: -1+0*x,
-                1:lambda x,y: 0*x,
-                2:lambda x,y: 1+0*x
-                }[i](X[0],X[1])
-                
+        x=X[0]
+        y=X[1]
+        if i==0:
+            phi=1-x-y
+            dphi=np.array([-1.,-1.])
+        elif i==1:
+            phi=x
+            dphi=np.array([1.,0.])
+        elif i==2:
+            phi=y
+            dphi=np.array([0.,1.])
+        else:
+            raise IndexError("ElementTriP1.lbasis: basis function index out of range.")
         return phi,dphi
 
 class ElementTriP2(ElementH1):
@@ -1009,37 +1083,32 @@ class ElementTriP2(ElementH1):
     f_dofs=1
     dim=2
     maxdeg=2
-    
+
     def lbasis(self,X,i):
-        phi={
-            0:lambda x,y: 1-3*x-3*y+2*x**2+4*x*y+2*y**2,
-            1:lambda x,y: 2*x**2-x,
-            2:lambda x,y: 2*y**2-y,
-            3:lambda x,y: 4*x-4*x**2-4*x*y,
-            4:lambda x,y: 4*x*y,
-            5:lambda x,y: 4*y-4*x*y-4*y**2,
-            }[i](X[0],X[1])
-
-        dphi={}
-        dphi[0]={
-                0:lambda x,y: -3+4*x+4*y,
-                1:lambda x,y: 4*x-1,
-                2:lambda x,y: 0*x,
-                3:lambda x,y: 4-8*x-4*y,
-                4:lambda x,y: 4*y,
-                5:lambda x,y: -4*y,
-                }[i](X[0],X[1])
-        dphi[1]={
-                0:lambda x,y: -3+4*x+4*y,
-                1:lambda x,y: 0*x,
-                2:lambda x,y: 4*y-1,
-                3:lambda x,y: -4*x,
-                4:lambda x,y: 4*x,
-                5:lambda x,y: 4-4*x-8*y,
-                }[i](X[0],X[1])
-                
+        x=X[0]
+        y=X[1]
+        if i==0:
+            phi=1-3*x-3*y+2*x**2+4*x*y+2*y**2
+            dphi=np.array([-3+4*x+4*y,-3+4*x+4*y])
+        elif i==1:
+            phi=2*x**2-x
+            dphi=np.array([4*x-1,np.zeros_like(x)])
+        elif i==2:
+            phi=2*y**2-y
+            dphi=np.array([np.zeros_like(x),4*y-1])
+        elif i==3:
+            phi=4*x-4*x**2-4*x*y
+            dphi=np.array([4-8*x-4*y,-4*x])
+        elif i==4:
+            phi=4*x*y
+            dphi=np.array([4*y,4*x])
+        elif i==5:
+            phi=4*y-4*x*y-4*y**2
+            dphi=np.array([-4*y,4-4*x-8*y])
+        else:
+            raise IndexError("ElementTriP2.lbasis: basis function index out of range.")
         return phi,dphi
-        
+
 class ElementTetP1(ElementH1):
     """The simplest tetrahedral element."""
     
@@ -1047,33 +1116,24 @@ class ElementTetP1(ElementH1):
     maxdeg=1
     dim=3
 
-    def lbasis(self,X,i):
-
-        phi={
-            0:lambda x,y,z: 1-x-y-z,
-            1:lambda x,y,z: x,
-            2:lambda x,y,z: y,
-            3:lambda x,y,z: z,
-            }[i](X[0],X[1],X[2])
-
-        dphi={}
-        dphi[0]={
-                0:lambda x,y,z: -1+0*x,
-                1:lambda x,y,z: 1+0*x,
-                2:lambda x,y,z: 0*x,
-                3:lambda x,y,z: 0*x
-                }[i](X[0],X[1],X[2])
-        dphi[1]={
-                0:lambda x,y,z: -1+0*x,
-                1:lambda x,y,z: 0*x,
-                2:lambda x,y,z: 1+0*x,
-                3:lambda x,y,z: 0*x
-                }[i](X[0],X[1],X[2])
-        dphi[2]={
-                0:lambda x,y,z: -1+0*x,
-                1:lambda x,y,z: 0*x,
-                2:lambda x,y,z: 0*x,
-                3:lambda x,y,z: 1+0*x
-                }[i](X[0],X[1],X[2])
+    _dphi_const=((-1.,-1.,-1.),(1.,0.,0.),(0.,1.,0.),(0.,0.,1.))
 
+    def lbasis(self,X,i):
+        x=X[0]
+        y=X[1]
+        z=X[2]
+        if i==0:
+            phi=1-x-y-z
+            dphi=np.array([-1.,-1.,-1.])
+        elif i==1:
+            phi=x
+            dphi=np.array([1.,0.,0.])
+        elif i==2:
+            phi=y
+            dphi=np.array([0.,1.,0.])
+        elif i==3:
+            phi=z
+            dphi=np.array([0.,0.,1.])
+        else:
+            raise IndexError("ElementTetP1.lbasis: basis function index out of range.")
         return phi,dphi
@@ -28,7 +28,8 @@ class Mapping:
     def DF(self,X,tind):
         raise NotImplementedError("DF() not implemented!")
 
-    def invDF(self,X,tind):
+    def invDF(self,X,tind,dtype=None):
+        """Inverse Jacobian, optionally in the floating point type dtype."""
         raise NotImplementedError("invDF() not implemented!")
 
     def detDF(self,X,tind):
@@ -98,7 +99,6 @@ class MappingQ1(Mapping):
    
     def F(self,Y,tind=None):
         """Mapping defined by Q1 basis."""
-        out={}
 
         if not isinstance(Y,dict):
             X={}
@@ -110,6 +110,8 @@ class MappingQ1(Mapping):
         if tind is None:
             tind=range(self.t.shape[1])
 
+        # a single C-contiguous array of size 2 x Nelems x Nqp
+        out=np.empty((2,len(tind))+np.shape(X[0])[-1:])
         out[0]=self.p[0,self.t[0,tind]][:,None]*self.quadbasis(X[0],X[1],0)+\
                self.p[0,self.t[1,tind]][:,None]*self.quadbasis(X[0],X[1],1)+\
                self.p[0,self.t[2,tind]][:,None]*self.quadbasis(X[0],X[1],2)+\
@@ -124,8 +126,8 @@ class MappingQ1(Mapping):
     def invF(self,x,tind=None):
         """Inverse map. Perform Newton iteration."""
         X={}
-        X[0]=0*x[0]
-        X[1]=0*x[1]
+        X[0]=np.zeros_like(x[0])
+        X[1]=np.zeros_like(x[1])
         for itr in range(1): # One Newton iteration. Should be enough?
             g={}
             F=self.F(X,tind)
@@ -150,7 +152,7 @@ class MappingQ1(Mapping):
                   self.J[0][1](X[0,:],X[1,:],tind)*self.J[1][0](X[0,:],X[1,:],tind)
         return detDF
             
-    def invDF(self,X,tind=None):
+    def invDF(self,X,tind=None,dtype=None):
         invJ={0:{},1:{}}
         if isinstance(X,dict):
             x=X[0]
@@ -167,20 +169,20 @@ class MappingQ1(Mapping):
         invJ[0][1]=-self.J[0][1](x,y,tind)/detDF
         invJ[1][0]=-self.J[1][0](x,y,tind)/detDF
         invJ[1][1]=self.J[0][0](x,y,tind)/detDF
-        
-        return invJ
+
+        # stack to an array of size 2 x 2 x Nelems x Nqp
+        return np.array([[invJ[0][0],invJ[0][1]],
+                         [invJ[1][0],invJ[1][1]]],dtype=dtype)
         
     def G(self,X,find=None):
         """Boundary mapping :math:`G(X)=BX+c`."""
-        y={}
         if find is None:
-            y[0]=np.outer(self.B[0],X).T+self.c[0]
-            y[1]=np.outer(self.B[1],X).T+self.c[1]
-        else:
-            y[0]=np.outer(self.B[0][find],X).T+self.c[0][find]
-            y[1]=np.outer(self.B[1][find],X).T+self.c[1][find]
-        y[0]=y[0].T
-        y[1]=y[1].T
+            find=slice(None)
+        # a single C-contiguous array of size 2 x Nfacets x Nqp
+        X=np.ravel(X)
+        y=np.empty((2,len(self.c[0][find]),X.shape[0]))
+        for i in range(2):
+            y[i]=self.c[i][find][:,None]+self.B[i][find][:,None]*X
         return y
         
     def detDG(self,X,find=None):
@@ -304,45 +306,25 @@ class MappingAffine(Mapping):
         else:
             raise TypeError("MappingAffine initialized with an incompatible mesh type!")
 
+        if self.dim>1:
+            # A and invA stacked into arrays of size dim x dim x Nelems
+            self._A=self._stack(self.A)
+            self._invA=self._stack(self.invA)
+
     def F(self,X,tind=None):
         """Affine map F(X)=AX+b."""
-        y={}
         if self.dim==1:
             y=np.outer(self.A,X[0,:]).T+self.b
             y=y.T
-        elif self.dim==2:
+        elif self.dim==2 or self.dim==3:
             if tind is None:
-                y[0]=np.outer(self.A[0][0],X[0,:]).T+np.outer(self.A[0][1],X[1,:]).T+self.b[0]
-                y[1]=np.outer(self.A[1][0],X[0,:]).T+np.outer(self.A[1][1],X[1,:]).T+self.b[1]
-            else: # TODO check this could have error
-                y[0]=np.outer(self.A[0][0][tind],X[0,:]).T+np.outer(self.A[0][1][tind],X[1,:]).T+self.b[0][tind]
-                y[1]=np.outer(self.A[1][0][tind],X[0,:]).T+np.outer(self.A[1][1][tind],X[1,:]).T+self.b[1][tind]
-            y[0]=y[0].T
-            y[1]=y[1].T
-        elif self.dim==3:
-            if tind is None:
-                y[0]=np.outer(self.A[0][0],X[0,:]).T+\
-                     np.outer(self.A[0][1],X[1,:]).T+\
-                     np.outer(self.A[0][2],X[2,:]).T+self.b[0]
-                y[1]=np.outer(self.A[1][0],X[0,:]).T+\
-                     np.outer(self.A[1][1],X[1,:]).T+\
-                     np.outer(self.A[1][2],X[2,:]).T+self.b[1]
-                y[2]=np.outer(self.A[2][0],X[0,:]).T+\
-                     np.outer(self.A[2][1],X[1,:]).T+\
-                     np.outer(self.A[2][2],X[2,:]).T+self.b[2]
-            else: # TODO check this could have error
-                y[0]=np.outer(self.A[0][0][tind],X[0,:]).T+\
-                     np.outer(self.A[0][1][tind],X[1,:]).T+\
-                     np.outer(self.A[0][2][tind],X[2,:]).T+self.b[0][tind]
-                y[1]=np.outer(self.A[1][0][tind],X[0,:]).T+\
-                     np.outer(self.A[1][1][tind],X[1,:]).T+\
-                     np.outer(self.A[1][2][tind],X[2,:]).T+self.b[1][tind]
-                y[2]=np.outer(self.A[2][0][tind],X[0,:]).T+\
-                     np.outer(self.A[2][1][tind],X[1,:]).T+\
-                     np.outer(self.A[2][2][tind],X[2,:]).T+self.b[2][tind]
-            y[0]=y[0].T
-            y[1]=y[1].T
-            y[2]=y[2].T
+                tind=slice(None)
+            # a single C-contiguous array of size dim x Nelems x Nqp
+            y=np.empty((self.dim,len(self.b[0][tind]),X.shape[1]))
+            for i in range(self.dim):
+                y[i]=self.b[i][tind][:,None]
+                for j in range(self.dim):
+                    y[i]+=self.A[i][j][tind][:,None]*X[j,:]
         else:
              raise NotImplementedError("MappingAffine.F: given dimension not implemented yet!")
         return y
@@ -388,81 +370,57 @@ class MappingAffine(Mapping):
 
     def G(self,X,find=None):
         """Boundary mapping G(X)=Bx+c."""
-        y={}
+        if find is None:
+            find=slice(None)
         if self.dim==2:
-            if find is None:
-                y[0]=np.outer(self.B[0],X).T+self.c[0]
-                y[1]=np.outer(self.B[1],X).T+self.c[1]
-            else:
-                y[0]=np.outer(self.B[0][find],X).T+self.c[0][find]
-                y[1]=np.outer(self.B[1][find],X).T+self.c[1][find]
-            y[0]=y[0].T
-            y[1]=y[1].T
+            # a single C-contiguous array of size dim x Nfacets x Nqp
+            X=np.ravel(X)
+            y=np.empty((2,len(self.c[0][find]),X.shape[0]))
+            for i in range(2):
+                y[i]=self.c[i][find][:,None]+self.B[i][find][:,None]*X
         elif self.dim==3:
-            if find is None:
-                y[0]=np.outer(self.B[0][0],X[0,:]).T+np.outer(self.B[0][1],X[1,:]).T+self.c[0]
-                y[1]=np.outer(self.B[1][0],X[0,:]).T+np.outer(self.B[1][1],X[1,:]).T+self.c[1]
-                y[2]=np.outer(self.B[2][0],X[0,:]).T+np.outer(self.B[2][1],X[1,:]).T+self.c[2]
-            else:
-                y[0]=np.outer(self.B[0][0][find],X[0,:]).T+np.outer(self.B[0][1][find],X[1,:]).T+self.c[0][find]
-                y[1]=np.outer(self.B[1][0][find],X[0,:]).T+np.outer(self.B[1][1][find],X[1,:]).T+self.c[1][find]
-                y[2]=np.outer(self.B[2][0][find],X[0,:]).T+np.outer(self.B[2][1][find],X[1,:]).T+self.c[2][find]
-            y[0]=y[0].T
-            y[1]=y[1].T
-            y[2]=y[2].T
+            y=np.empty((3,len(self.c[0][find]),X.shape[1]))
+            for i in range(3):
+                y[i]=self.c[i][find][:,None]
+                for j in range(2):
+                    y[i]+=self.B[i][j][find][:,None]*X[j,:]
         else:
             raise NotImplementedError("MappingAffine.G: given dimension not implemented yet!")
         return y
 
     def DF(self,X,tind=None):
-        A=copy.deepcopy(self.A)
-        
+        if self.dim==1:
+            return copy.deepcopy(self.A)
+        return self._tile(self._A,X,tind)
+
+    def _stack(self,A):
+        return np.array([[A[i][j] for j in range(self.dim)]
+                         for i in range(self.dim)])
+
+    def _tile(self,A,X,tind,dtype=None):
+        # Repeat the stacked matrices A of the given elements for all
+        # quadrature points. The result is a read-only view of size
+        # dim x dim x Nelems x Nqp. A is cast to dtype before it is
+        # repeated so that only dim x dim x Nelems values are converted.
         if isinstance(X,dict):
             N=X[0].shape[1]
         else:
             N=X.shape[1]
-        
-        if self.dim==2:
-            if tind is None: # TODO did not test
-                A[0][0]=np.tile(A[0][0],(N,1)).T
-                A[0][1]=np.tile(A[0][1],(N,1)).T
-                A[1][0]=np.tile(A[1][0],(N,1)).T
-                A[1][1]=np.tile(A[1][1],(N,1)).T
-            else:
-                A[0][0]=np.tile(A[0][0][tind],(N,1)).T
-                A[0][1]=np.tile(A[0][1][tind],(N,1)).T
-                A[1][0]=np.tile(A[1][0][tind],(N,1)).T
-                A[1][1]=np.tile(A[1][1][tind],(N,1)).T
-        if self.dim==3:
-            if tind is None: # TODO did not test
-                A[0][0]=np.tile(A[0][0],(N,1)).T
-                A[0][1]=np.tile(A[0][1],(N,1)).T
-                A[0][2]=np.tile(A[0][2],(N,1)).T
-                A[1][0]=np.tile(A[1][0],(N,1)).T
-                A[1][1]=np.tile(A[1][1],(N,1)).T
-                A[1][2]=np.tile(A[1][2],(N,1)).T
-                A[2][0]=np.tile(A[2][0],(N,1)).T
-                A[2][1]=np.tile(A[2][1],(N,1)).T
-                A[2][2]=np.tile(A[2][2],(N,1)).T
-            else:
-                A[0][0]=np.tile(A[0][0][tind],(N,1)).T
-                A[0][1]=np.tile(A[0][1][tind],(N,1)).T
-                A[0][2]=np.tile(A[0][2][tind],(N,1)).T
-                A[1][0]=np.tile(A[1][0][tind],(N,1)).T
-                A[1][1]=np.tile(A[1][1][tind],(N,1)).T
-                A[1][2]=np.tile(A[1][2][tind],(N,1)).T
-                A[2][0]=np.tile(A[2][0][tind],(N,1)).T
-                A[2][1]=np.tile(A[2][1][tind],(N,1)).T
-                A[2][2]=np.tile(A[2][2][tind],(N,1)).T           
-                
-        return A
-        
+
+        if tind is not None:
+            A=A[:,:,tind]
+        if dtype is not None:
+            A=A.astype(dtype,copy=False)
+
+        return np.broadcast_to(A[:,:,:,None],A.shape+(N,))
+
     def detDF(self,X,tind=None):
         if tind is None:
             detDF=self.detA
         else:
             detDF=self.detA[tind]
-        return np.tile(detDF,(X.shape[1],1)).T  
+        # a read-only view, the same value at every quadrature point
+        return np.broadcast_to(detDF[:,None],(detDF.shape[0],X.shape[1]))
         
     def detDG(self,X,find=None):
         if find is None:
@@ -523,45 +481,7 @@ class MappingAffine(Mapping):
 
         return N # n[0] etc. are of size Nfacets x Nqp
         
-    def invDF(self,X,tind=None):
-        invA=copy.deepcopy(self.invA)
-        
-        if isinstance(X,dict):
-            N=X[0].shape[1]
-        else:
-            N=X.shape[1]
-        
-        if self.dim==2:
-            if tind is None: # TODO did not test
-                invA[0][0]=np.tile(invA[0][0],(N,1)).T
-                invA[0][1]=np.tile(invA[0][1],(N,1)).T
-                invA[1][0]=np.tile(invA[1][0],(N,1)).T
-                invA[1][1]=np.tile(invA[1][1],(N,1)).T
-            else:
-                invA[0][0]=np.tile(invA[0][0][tind],(N,1)).T
-                invA[0][1]=np.tile(invA[0][1][tind],(N,1)).T
-                invA[1][0]=np.tile(invA[1][0][tind],(N,1)).T
-                invA[1][1]=np.tile(invA[1][1][tind],(N,1)).T
-        elif self.dim==3:
-            if tind is None: # TODO did not test
-                invA[0][0]=np.tile(invA[0][0],(N,1)).T
-                invA[0][1]=np.tile(invA[0][1],(N,1)).T
-                invA[0][2]=np.tile(invA[0][2],(N,1)).T
-                invA[1][0]=np.tile(invA[1][0],(N,1)).T
-                invA[1][1]=np.tile(invA[1][1],(N,1)).T
-                invA[1][2]=np.tile(invA[1][2],(N,1)).T
-                invA[2][0]=np.tile(invA[2][0],(N,1)).T
-                invA[2][1]=np.tile(invA[2][1],(N,1)).T
-                invA[2][2]=np.tile(invA[2][2],(N,1)).T
-            else:
-                invA[0][0]=np.tile(invA[0][0][tind],(N,1)).T
-                invA[0][1]=np.tile(invA[0][1][tind],(N,1)).T
-                invA[0][2]=np.tile(invA[0][2][tind],(N,1)).T
-                invA[1][0]=np.tile(invA[1][0][tind],(N,1)).T
-                invA[1][1]=np.tile(invA[1][1][tind],(N,1)).T
-                invA[1][2]=np.tile(invA[1][2][tind],(N,1)).T
-                invA[2][0]=np.tile(invA[2][0][tind],(N,1)).T
-                invA[2][1]=np.tile(invA[2][1][tind],(N,1)).T
-                invA[2][2]=np.tile(invA[2][2][tind],(N,1)).T           
-                
-        return invA
+    def invDF(self,X,tind=None,dtype=None):
+        if self.dim==1:
+            return np.array(self.invA,dtype=dtype)
+        return self._tile(self._invA,X,tind,dtype)
@@ -185,9 +185,10 @@ class MeshLine(Mesh):
         newp = np.hstack((p, 0.5*(p[:, self.t[0, :]] + p[:, self.t[1, :]])))
         newt = np.vstack((t[0, :], mid))
         newt = np.hstack((newt, np.vstack((mid, t[1, :]))))
-        # update fields
-        self.p = newp
-        self.t = newt
+        # update fields, as contiguous arrays of the same types as the
+        # initial meshes
+        self.p = np.ascontiguousarray(newp, dtype=np.float64)
+        self.t = np.ascontiguousarray(newt, dtype=np.intp)
 
     def boundary_nodes(self):
         """Find the boundary nodes of the mesh."""
@@ -346,9 +347,10 @@ class MeshQuad(Mesh):
                                            mid,
                                            t2f[2, :],
                                            t[3, :]))))
-        # update fields
-        self.p = newp
-        self.t = newt
+        # update fields, as contiguous arrays of the same types as the
+        # initial meshes
+        self.p = np.ascontiguousarray(newp, dtype=np.float64)
+        self.t = np.ascontiguousarray(newt, dtype=np.intp)
 
         self._build_mappings()
 
@@ -624,9 +626,10 @@ class MeshTet(Mesh):
                                            t2e[3, c3], t2e[2, c3]))))
         newt = np.hstack((newt, np.vstack((t2e[0, c3], t2e[5, c3],
                                            t2e[2, c3], t2e[1, c3]))))
-        # update fields
-        self.p = newp
-        self.t = newt
+        # update fields, as contiguous arrays of the same types as the
+        # initial meshes
+        self.p = np.ascontiguousarray(newp, dtype=np.float64)
+        self.t = np.ascontiguousarray(newt, dtype=np.intp)
 
         self._build_mappings()
 
@@ -781,14 +784,14 @@ class MeshTri(Mesh):
         if p is None and t is None:
             if initmesh is 'symmetric':
                 p = np.array([[0, 1, 1, 0, 0.5],
-                              [0, 0, 1, 1, 0.5]], dtype=np.float_)
+                              [0, 0, 1, 1, 0.5]], dtype=np.float64)
                 t = np.array([[0, 1, 4],
                               [1, 2, 4],
                               [2, 3, 4],
                               [0, 3, 4]], dtype=np.intp).T
             elif initmesh is 'sqsymmetric':
                 p = np.array([[0, 0.5, 1,   0, 0.5,   1, 0, 0.5, 1],
-                              [0, 0,   0, 0.5, 0.5, 0.5, 1,   1, 1]], dtype=np.float_)
+                              [0, 0,   0, 0.5, 0.5, 0.5, 1,   1, 1]], dtype=np.float64)
                 t = np.array([[0, 1, 4],
                               [1, 2, 4],
                               [2, 4, 5],
@@ -799,10 +802,10 @@ class MeshTri(Mesh):
                               [4, 5, 8]], dtype=np.intp).T
             elif initmesh is 'reftri':
                 p = np.array([[0, 1, 0],
-                              [0, 0, 1]], dtype=np.float_)
+                              [0, 0, 1]], dtype=np.float64)
                 t = np.array([[0, 1, 2]], dtype=np.intp).T
             else:
-                p = np.array([[0, 1, 0, 1], [0, 0, 1, 1]], dtype=np.float_)
+                p = np.array([[0, 1, 0, 1], [0, 0, 1, 1]], dtype=np.float64)
                 t = np.array([[0, 1, 2], [1, 3, 2]], dtype=np.intp).T
         elif p is None or t is None:
             raise Exception("Must provide p AND t or neither")
@@ -1059,9 +1062,10 @@ class MeshTri(Mesh):
         newt = np.hstack((newt, np.vstack((t[1, :], t2f[0, :], t2f[1, :]))))
         newt = np.hstack((newt, np.vstack((t[2, :], t2f[2, :], t2f[1, :]))))
         newt = np.hstack((newt, np.vstack((t2f[0, :], t2f[1, :], t2f[2, :]))))
-        # update fields
-        self.p = newp
-        self.t = newt
+        # update fields, as contiguous arrays of the same types as the
+        # initial meshes
+        self.p = np.ascontiguousarray(newp, dtype=np.float64)
+        self.t = np.ascontiguousarray(newt, dtype=np.intp)
 
         self._build_mappings()
 
@@ -125,22 +125,58 @@ class AssemblerAbstractP1Comparison(unittest.TestCase):
 
         self.assertAlmostEqual(C.data[0],D.data[0],places=10)
 
-class AssemblerTriP1BasicTest(unittest.TestCase):
-    def setUp(self):
-        self.mesh=fmsh.MeshTri()
-        self.mesh.refine(5)
+# factors of the SPD test matrices, see factorize
+_factors={}
+
+def factorize(A):
+    """Factorize the SPD matrix A and return a solver. The factor of an
+    identical matrix is reused between tests."""
+    A=A.tocsc()
+    key=(A.shape,A.indptr.tobytes(),A.indices.tobytes(),A.data.tobytes())
+    if key not in _factors:
+        try:
+            from sksparse.cholmod import cholesky
+            _factors[key]=cholesky(A)
+        except ImportError:
+            # UMFPACK if available, SuperLU otherwise
+            _factors[key]=scipy.sparse.linalg.factorized(A)
+    return _factors[key]
+
+# the shared mesh and stiffness matrix, see p1_poisson
+_p1_poisson={}
+
+def p1_poisson():
+    """Return the refined mesh, its boundary and interior nodes, a P1
+    assembler, the stiffness matrix K and a solver for the interior
+    block of K. They are built on the first call and reused by the
+    tests, which only read them."""
+    if not _p1_poisson:
+        mesh=fmsh.MeshTri()
+        mesh.refine(5)
 
         # boundary and interior node sets
-        D1=np.nonzero(self.mesh.p[0,:]==0)[0]
-        D2=np.nonzero(self.mesh.p[1,:]==0)[0]
-        D3=np.nonzero(self.mesh.p[0,:]==1)[0]
-        D4=np.nonzero(self.mesh.p[1,:]==1)[0]
+        p=mesh.p
+        boundary=(p[0,:]==0)|(p[1,:]==0)|(p[0,:]==1)|(p[1,:]==1)
+        D=np.flatnonzero(boundary)
+        I=np.flatnonzero(~boundary)
+
+        # the Poisson tests share the stiffness matrix and its factor
+        a=fasm.AssemblerElement(mesh,felem.ElementTriP1())
+        K=a.iasm(lambda du,dv: du[0]*dv[0]+du[1]*dv[1])
 
-        D=np.union1d(D1,D2);
-        D=np.union1d(D,D3);
-        self.D=np.union1d(D,D4);
+        _p1_poisson.update(mesh=mesh,D=D,I=I,asm=a,K=K,
+                           solveK=factorize(K[I][:,I]))
+    return _p1_poisson
 
-        self.I=np.setdiff1d(np.arange(0,self.mesh.p.shape[1]),self.D)
+class AssemblerTriP1BasicTest(unittest.TestCase):
+    def setUp(self):
+        data=p1_poisson()
+        self.mesh=data['mesh']
+        self.D=data['D']
+        self.I=data['I']
+        self.asm=data['asm']
+        self.K=data['K']
+        self.solveK=data['solveK']
 
 class AssemblerTriP1Poisson(AssemblerTriP1BasicTest):
     """Simple Poisson test.
@@ -148,20 +184,89 @@ class AssemblerTriP1Poisson(AssemblerTriP1BasicTest):
     Solving $-\Delta u = 1$ in an unit square with $u=0$ on the boundary.
     """
     def runTest(self):
-        bilin=lambda u,v,du,dv,x,h: du[0]*dv[0]+du[1]*dv[1]
         lin=lambda v,dv,x,h: 1*v
 
-        a=fasm.AssemblerElement(self.mesh,felem.ElementTriP1())
-
-        A=a.iasm(bilin)
-        f=a.iasm(lin)
+        f=self.asm.iasm(lin)
 
-        x=np.zeros(A.shape[0])
+        x=np.zeros(self.K.shape[0])
         I=self.I
-        x[I]=scipy.sparse.linalg.spsolve(A[np.ix_(I,I)],f[I])
+        x[I]=self.solveK(f[I])
 
         self.assertAlmostEqual(np.max(x),0.073614737354524146)
 
+class AssemblerTriP1Float32(AssemblerTriP1BasicTest):
+    """Poisson test with the basis evaluated in single precision."""
+    def runTest(self):
+        I=self.I
+
+        e=felem.ElementTriP1()
+        e32=felem.ElementTriP1()
+        e32.dtype=np.float32
+
+        def dudv(du,dv):
+            return du[0]*dv[0]+du[1]*dv[1]
+
+        x={}
+        for key,elem in [('64',e),('32',e32)]:
+            a=fasm.AssemblerElement(self.mesh,elem)
+            A,f=a.iasm_multi([dudv,lambda v: 1*v])
+            x[key]=np.zeros(A.shape[0])
+            x[key][I]=factorize(A[I][:,I])(f[I])
+
+        self.assertAlmostEqual(np.max(np.abs(x['64']-x['32'])),0.0,places=5)
+
+class AssemblerTriP2Float32(unittest.TestCase):
+    """Poisson test with the P2 basis, whose gradients are transformed
+    by the einsum path, evaluated in single precision."""
+    def runTest(self):
+        mesh=fmsh.MeshTri()
+        mesh.refine(3)
+
+        e=felem.ElementTriP2()
+        e32=felem.ElementTriP2()
+        e32.dtype=np.float32
+
+        def dudv(du,dv):
+            return du[0]*dv[0]+du[1]*dv[1]
+
+        x={}
+        for key,elem in [('64',e),('32',e32)]:
+            a=fasm.AssemblerElement(mesh,elem)
+            A,f=a.iasm_multi([dudv,lambda v: 1*v])
+            D=a.dofnum_u.getdofs(N=mesh.boundary_nodes(),
+                                 F=mesh.boundary_facets())
+            I=np.setdiff1d(np.arange(A.shape[0]),D)
+            x[key]=np.zeros(A.shape[0])
+            x[key][I]=scipy.sparse.linalg.spsolve(A[I][:,I],f[I])
+
+        # the global gradients are computed in single precision
+        X=np.array([[0.25,0.5],[0.25,0.1]])
+        tind=np.arange(mesh.t.shape[1])
+        du64=e.gbasis_all(a.mapping,e.precompute_at(X,6),tind,6)[3][1]
+        du32=e32.gbasis_all(a.mapping,e32.precompute_at(X,6),tind,6)[3][1]
+        self.assertEqual(du32.dtype,np.float32)
+        self.assertTrue(np.max(np.abs(du32-du64))<1e-5*np.max(np.abs(du64)))
+
+        self.assertAlmostEqual(np.max(np.abs(x['64']-x['32'])),0.0,places=5)
+
+class AssemblerTriP1Threads(AssemblerTriP1BasicTest):
+    """Compare threaded assembly to the serial one."""
+    def runTest(self):
+        def dudv(du,dv):
+            return du[0]*dv[0]+du[1]*dv[1]
+
+        def fv(v,x):
+            return np.sin(np.pi*x[0])*v
+
+        a=fasm.AssemblerElement(self.mesh,felem.ElementTriP1())
+        at=fasm.AssemblerElement(self.mesh,felem.ElementTriP1(),
+                                 threads=2,thread_cutoff=0)
+        K,f=a.iasm_multi([dudv,fv])
+        Kt,ft=at.iasm_multi([dudv,fv])
+
+        self.assertAlmostEqual(abs(K-Kt).sum(),0.0,places=12)
+        self.assertAlmostEqual(np.linalg.norm(f-ft),0.0,places=12)
+
 class AssemblerTriP1AnalyticWithXY(AssemblerTriP1BasicTest):
     """Poisson test case with analytic solution.
 
@@ -169,57 +274,73 @@ class AssemblerTriP1AnalyticWithXY(AssemblerTriP1BasicTest):
     """
     def runTest(self):
         I=self.I
-        D=self.D
-
-        a=fasm.AssemblerElement(self.mesh,felem.ElementTriP1())
+        a=self.asm
 
-        def dudv(du,dv):
-            return du[0]*dv[0]+du[1]*dv[1]
-        K=a.iasm(dudv)
+        # the load is evaluated once at the quadrature points, in single
+        # precision which is plenty for the tolerance below; coeff*v is
+        # upcast so the integrals are still summed in double precision
+        qx=a.iqpoints().astype(np.float32)
+        coeff=2*np.pi**2*np.sin(np.pi*qx[0])*np.sin(np.pi*qx[1])
+        def fv(v):
+            return coeff*v
 
-        def fv(v,x):
-                return 2*np.pi**2*np.sin(np.pi*x[0])*np.sin(np.pi*x[1])*v
         f=a.iasm(fv)
 
+        x=np.zeros(self.K.shape[0])
+        x[I]=self.solveK(f[I])
 
-        x=np.zeros(K.shape[0])
-        x[I]=scipy.sparse.linalg.spsolve(K[np.ix_(I,I)],f[I])
+        # the nodal error |x-u| is formed in place in a single array
+        err=np.sin(np.pi*self.mesh.p[0,:])
+        err*=np.sin(np.pi*self.mesh.p[1,:])
+        np.subtract(x,err,out=err)
+        np.abs(err,out=err)
 
-        def truex():
-            X=self.mesh.p[0,:]
-            Y=self.mesh.p[1,:]
-            return np.sin(np.pi*X)*np.sin(np.pi*Y)
+        # the largest nodal error is about 8e-4 with h=1/32
+        self.assertLess(np.max(err),1e-3)
 
-        self.assertAlmostEqual(np.max(x-truex()),0.0,places=3)
 
 
+class AssemblerTriP1Form(AssemblerTriP1BasicTest):
+    """Compare forms compiled from expressions to the equivalent lambdas."""
+    def runTest(self):
+        a=self.asm
+
+        K=a.iasm(fasm.form("du[0]*dv[0]+du[1]*dv[1]"))
+        self.assertAlmostEqual(abs(K-self.K).sum(),0.0,places=12)
+
+        f1=a.iasm(fasm.form("2*pi**2*sin(pi*x[0])*np.sin(pi*x[1])*v"))
+        f2=a.iasm(lambda v,x: 2*np.pi**2*np.sin(np.pi*x[0])*np.sin(np.pi*x[1])*v)
+        self.assertAlmostEqual(np.linalg.norm(f1-f2),0.0,places=12)
 
 class AssemblerTriP1FullPoisson(AssemblerTriP1BasicTest):
     """Poisson test from Huhtala's MATLAB package."""
     def runTest(self):
-        F=lambda x,y: 100.0*((x>=0.4)&(x<=0.6)&(y>=0.4)&(y<=0.6))
-        G=lambda x,y: (y==0)*1.0+(y==1)*(-1.0)
+        # indicator of the loaded square, stored as bytes
+        F=lambda x,y: np.logical_and.reduce((x>=0.4,x<=0.6,
+                                             y>=0.4,y<=0.6)).astype(np.uint8)
+        G=lambda x,y: np.where(y==0,1.0,np.where(y==1,-1.0,0.0))
 
-        a=fasm.AssemblerElement(self.mesh,felem.ElementTriP1())
+        a=self.asm
+        K=self.K
 
-        dudv=lambda du,dv: du[0]*dv[0]+du[1]*dv[1]
-        K=a.iasm(dudv)
+        qx=a.iqpoints()
+        coeff=F(qx[0],qx[1])
+        fv=lambda v: 100.0*coeff*v
+        f=a.iasm(fv)
 
         uv=lambda u,v: u*v
         B=a.fasm(uv)
-        
-        fv=lambda v,x: F(x[0],x[1])*v
-        f=a.iasm(fv)
 
-        gv=lambda v,x: G(x[0],x[1])*v
+        qx=a.fqpoints()
+        gvals=G(qx[0],qx[1])
+        gv=lambda v: gvals*v
         g=a.fasm(gv)
 
-        D=np.nonzero(self.mesh.p[0,:]==0)[0]
-        I=np.setdiff1d(np.arange(0,self.mesh.p.shape[1]),D)
+        # Dirichlet condition on x=0 only
+        I=np.flatnonzero(self.mesh.p[0,:]!=0)
 
         x=np.zeros(K.shape[0])
-        x[I]=scipy.sparse.linalg.spsolve(K[np.ix_(I,I)]+B[np.ix_(I,I)],
-                                         f[I]+g[I])
+        x[I]=factorize((K+B).tocsr()[I][:,I])(f[I]+g[I])
 
         self.assertAlmostEqual(np.max(x),1.89635971369,places=2)
 
@@ -394,6 +394,24 @@ class TriPpTest(unittest.TestCase):
 
             self.assertTrue(pfit[0]>=0.95*p)
 
+class TriPpPolynomialTest(unittest.TestCase):
+    """Check that the local basis of ElementTriPp(5) spans all
+    polynomials of degree 5, i.e. that the interior functions are
+    taken from the basis of order p-3."""
+    def runTest(self):
+        p=5
+        e=felem.ElementTriPp(p)
+
+        X=np.random.RandomState(0).rand(2,60)
+        X=X[:,X.sum(axis=0)<1.]
+        phi,dphi=e.lbasis_all(X)
+
+        for i in range(p+1):
+            for j in range(p+1-i):
+                m=X[0]**i*X[1]**j
+                c=np.linalg.lstsq(phi.T,m,rcond=-1)[0]
+                self.assertTrue(np.max(np.abs(phi.T.dot(c)-m))<1e-10)
+
 class TetP1Test(unittest.TestCase):
     """Test tetrahedral refinements with P1 elements.
     Also tests assembly on tetrahedral facets."""
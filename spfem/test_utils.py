@@ -0,0 +1,36 @@
+import unittest
+import numpy as np
+from spfem.utils import LazyZero
+
+class LazyZeroArithmetic(unittest.TestCase):
+    """Compare the arithmetic of LazyZero to that of np.zeros."""
+    def runTest(self):
+        shape=(3,2)
+        z=LazyZero(shape)
+        Z=np.zeros(shape)
+        a=np.arange(1.,7.).reshape(shape)
+
+        # products and quotients are still lazy
+        self.assertTrue(z*a is z)
+        self.assertTrue(a*z is z)
+        self.assertTrue(2.*z is z)
+        self.assertTrue(z/a is z)
+        self.assertTrue(-z is z)
+        self.assertTrue(z**2 is z)
+
+        # sums reduce to the other operand
+        self.assertTrue(z+a is a)
+        self.assertTrue(a+z is a)
+        self.assertTrue(a-z is a)
+        np.testing.assert_array_equal(z-a,Z-a)
+
+        # the rest give what the zero array gives
+        np.testing.assert_array_equal(z**0,Z**0)
+        np.testing.assert_array_equal(2.**z,2.**Z)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            np.testing.assert_array_equal(a/z,a/Z)
+            np.testing.assert_array_equal(z**-1,Z**-1)
+
+        np.testing.assert_array_equal(np.asarray(z),Z)
+        np.testing.assert_array_equal(np.array(z,copy=True),Z)
+        self.assertEqual(np.asarray(z,dtype=np.float32).dtype,np.float32)
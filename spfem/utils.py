@@ -20,10 +20,14 @@ def stack(block):
     return sp.vstack(map(sp.hstack, block))
 
 def cell_shape(x, *rest):
-    """Find out the shape of a cell array."""
+    """Find out the shape of a cell array. The leading axes of arrays with
+    more than two dimensions (e.g. gradients of size dim x Nelems x Nqp)
+    count as cells."""
     if isinstance(x, dict):
         s = len(x)
         return cell_shape(x[0], s, *rest)
+    elif isinstance(x, np.ndarray) and x.ndim > 2:
+        return rest[::-1] + x.shape[:-2]
     else:
         return rest[::-1]
 
@@ -49,6 +53,65 @@ def const_cell(nparr, *arg):
         u = {i: const_cell(nparr, *arg[1:]) for (i, _) in enumerate(range(arg[0]))}
     return u
 
+class LazyZero(object):
+    """A zero array of the given shape that is never allocated.
+
+    Products with LazyZero are LazyZero and sums reduce to the other
+    operand, so the terms of a form that are known to vanish (e.g. the
+    zero components of vectorial elements) are not evaluated. Where an
+    actual array is needed, it converts to np.zeros(shape).
+    """
+    # make numpy defer binary operations to the methods below
+    __array_priority__ = 100.0
+
+    def __init__(self, shape):
+        self.shape = shape
+
+    def __array__(self, dtype=None, copy=None):
+        # a new array is always created, whatever copy is
+        return np.zeros(self.shape, dtype=dtype)
+
+    def __mul__(self, other):
+        return self
+
+    __rmul__ = __mul__
+
+    def __div__(self, other):
+        return self
+
+    __truediv__ = __div__
+
+    def __rdiv__(self, other):
+        # division by zero, inf or nan as with numpy arrays
+        return other/np.zeros(self.shape)
+
+    __rtruediv__ = __rdiv__
+
+    def __pow__(self, other):
+        if np.isscalar(other) and other > 0:
+            return self
+        # 0**0 is one and negative powers are inf
+        return np.zeros(self.shape)**other
+
+    def __rpow__(self, other):
+        return other**np.zeros(self.shape)
+
+    def __neg__(self):
+        return self
+
+    __pos__ = __neg__
+
+    def __add__(self, other):
+        return other
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return -other
+
+    def __rsub__(self, other):
+        return other
+
 def direct(A, b, x=None, I=None, use_umfpack=True, cholmod=False):
     """Solve system Ax=b with Dirichlet boundary conditions.
     